@@ -1,22 +1,39 @@
+import time
+# Start of module import, reported by the warm-up
+_IMPORT_STARTED = time.perf_counter()
+
 from fastapi import FastAPI, UploadFile, File, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import subprocess
-import pickle
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import pandas as pd
 import numpy as np
-import shap
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import os
 import uuid
+import functools
+import json
 import shutil
+import tarfile
 import base64
-from io import BytesIO
 from datetime import datetime
 from pathlib import Path
+import asyncio
 import traceback
+import warnings
+from typing import List
+
+from api.cache import InputVersions, PlotCache, ResultCache, StageCache, cache_key
+from api.features import GENOME_ID, HIT_FILES, FeatureTemplates, GenomeFeatures, read_genome_features, stack
+from api.jobs import Job, JobScheduler, JobSlots, JobStore, QueueFull
+from api.metrics import MetricsRegistry
+from api.pipeline import (REQUIRED_TOOLS, SNIPPY_REFERENCE_DIR, STAGES, run_pipeline, snippy_reference_state,
+                          StageError, StageTimeout)
+from api.plots import PlotPool
+from api.registry import ModelRegistry, model_paths
+from api.stages import StagePool
+from api.uploads import GENOME_FILE, InvalidGenome, check_size, spool_genome
+from api.warmup import HEAVY_MODULES, Warmup, import_modules, logger
 
 app = FastAPI(
     title="Salmonella AMR Prediction API",
@@ -33,18 +50,164 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-WORK_DIR = Path("/app/work")
+WORK_DIR = Path(os.getenv('WORK_DIR', '/app/work'))
+RESULTS_DIR = Path(os.getenv('RESULTS_DIR', '/app/results'))
+CACHE_DIR = Path(os.getenv('CACHE_DIR', '/app/cache'))
+TEMPLATES_DIR = Path(os.getenv('FEATURE_TEMPLATES_DIR', '/app/feature_templates'))
 MODELS_DIR = Path(os.getenv('MODELS_DIR', '/app/models'))
-SCRIPTS_DIR = Path(os.getenv('SCRIPTS_DIR', '/app/scripts'))
-
-MODELS = {
-    "pefoxacin_full": MODELS_DIR / "pefoxacin_full_model.pkl",
-    "trimethoprim_full": MODELS_DIR / "trimethoprim_full_model.pkl",
-    "sulfamethoxazole_full": MODELS_DIR / "sulfamethoxazole_full_model.pkl",
-    "pefoxacin_partial": MODELS_DIR / "pefoxacin_snps_kmers_model.pkl",
-    "trimethoprim_partial": MODELS_DIR / "trimethoprim_snps_kmers_model.pkl",
-    "sulfamethoxazole_partial": MODELS_DIR / "sulfamethoxazole_genes_snps_model.pkl"
+MAX_CONCURRENT_JOBS = int(os.getenv('MAX_CONCURRENT_JOBS', '2'))
+MAX_QUEUED_JOBS = int(os.getenv('MAX_QUEUED_JOBS', '4'))
+JOB_RESULT_TTL_SECONDS = int(os.getenv('JOB_RESULT_TTL_SECONDS', '3600'))
+RETRY_AFTER_SECONDS = 60
+MAX_POLL_WAIT_SECONDS = 60
+# /readyz fails below this much free space in WORK_DIR
+MIN_FREE_DISK_MB = int(os.getenv('MIN_FREE_DISK_MB', '1024'))
+RESULT_CACHE_MAX_MB = int(os.getenv('RESULT_CACHE_MAX_MB', '512'))
+STAGE_CACHE_MAX_MB = int(os.getenv('STAGE_CACHE_MAX_MB', '2048'))
+PLOT_CACHE_MAX_MB = int(os.getenv('PLOT_CACHE_MAX_MB', '256'))
+PIPELINE_VERSION = "1.0.0"
+MAX_BATCH_GENOMES = int(os.getenv('MAX_BATCH_GENOMES', '100'))
+GENOME_EXTENSIONS = ('.fna', '.fasta', '.fa')
+TARBALL_EXTENSIONS = ('.tar', '.tar.gz', '.tgz')
+PLOT_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+MODELS = model_paths(MODELS_DIR)
+registry = ModelRegistry(MODELS)
+templates = FeatureTemplates(TEMPLATES_DIR)
+# Which template each partial model was trained on (full models use "full")
+PARTIAL_TEMPLATES = {
+    "pefoxacin": "snps_kmers",
+    "trimethoprim": "snps_kmers",
+    "sulfamethoxazole": "genes_snps"
 }
+# Inputs are sparse rows checked against feature_names_in_ in aligned_batch()
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+# Everything besides the genome that can change a prediction: the models, every
+# template (all of them are compiled into the feature catalog the k-mer and SNP
+# stages match against) and each pipeline stage's scripts and inputs
+input_versions = InputVersions(
+    list(MODELS.values()) + sorted({path for stage in STAGES for path in stage.versions.paths}),
+    salt=PIPELINE_VERSION,
+    globs=[(TEMPLATES_DIR, "*.txt")]
+)
+result_cache = ResultCache(CACHE_DIR / "results", RESULT_CACHE_MAX_MB * 1024 * 1024)
+# Raw ABRicate/tblastn/Snippy outputs, reusable when only models or templates change
+stage_cache = StageCache(CACHE_DIR / "stages", STAGE_CACHE_MAX_MB * 1024 * 1024)
+# Rendered force plots, shared by every job with the same explanation
+plot_cache = PlotCache(CACHE_DIR / "plots", PLOT_CACHE_MAX_MB * 1024 * 1024)
+job_store = JobStore(RESULTS_DIR, JOB_RESULT_TTL_SECONDS)
+scheduler = JobScheduler(JobSlots(MAX_CONCURRENT_JOBS, MAX_QUEUED_JOBS), job_store)
+
+# Force plots render in separate processes, off the request threads
+plot_pool = PlotPool()
+# Gene, k-mer and SNP post-processing run in warm workers rather than fresh interpreters
+stage_pool = StagePool()
+
+def work_dir_bytes():
+    """Bytes held by job directories under WORK_DIR"""
+    total = 0
+    pending = [WORK_DIR]
+    while pending:
+        try:
+            entries = list(os.scandir(pending.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                else:
+                    total += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                pass
+    return total
+
+# Scraped from /metrics
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    "amr_stage_duration_seconds",
+    "Wall time of pipeline stages and in-process scoring steps (align, predict_proba, shap, plot)",
+    ["stage"])
+STAGE_FAILURES = metrics.counter(
+    "amr_stage_failures_total", "Pipeline stages that failed, by reason (error or timeout)", ["stage", "reason"])
+JOB_SECONDS = metrics.histogram(
+    "amr_job_duration_seconds", "Submission to completion of pipeline jobs, queueing included")
+JOBS = metrics.counter("amr_jobs_total", "Finished jobs by outcome (completed, cached, failed)", ["outcome"])
+metrics.callback_counter(
+    "amr_cache_requests_total", "Result, stage and plot cache lookups", ["cache", "result"],
+    lambda: {key: value
+             for name, cache in (("result", result_cache), ("stage", stage_cache), ("plot", plot_cache))
+             for key, value in (((name, "hit"), cache.hits), ((name, "miss"), cache.misses))})
+metrics.gauge("amr_jobs_in_flight", "Jobs admitted and not yet finished", callback=lambda: scheduler.in_flight)
+metrics.gauge("amr_jobs_running", "Jobs holding a worker slot", callback=lambda: scheduler.slots.running)
+metrics.gauge("amr_jobs_queued", "Jobs waiting for a worker slot", callback=lambda: scheduler.slots.queued)
+metrics.gauge("amr_job_slots_free", "Free worker slots", callback=lambda: scheduler.slots.free)
+metrics.gauge("amr_work_dir_bytes", "Disk used by job directories in WORK_DIR", callback=work_dir_bytes)
+metrics.gauge("amr_work_dir_free_bytes", "Free disk space on the WORK_DIR filesystem",
+              callback=lambda: int(free_disk_mb(WORK_DIR) * 1024 * 1024))
+# Running /predict/batch coordinators, cancelled on shutdown
+batch_tasks = set()
+
+# Worker startup progress; /health reports "starting" until it is ready
+warmup = Warmup()
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+def synthetic_prediction():
+    """Score a genome with no hits end to end: alignment, predict_proba and SHAP"""
+    predict_genomes([GenomeFeatures(GENOME_ID, {}, {kind: 0 for kind in HIT_FILES})])
+
+def check_snippy_reference():
+    """Only checks the stamp: preparing is 00c_prepare_reference.sh's job, at image build"""
+    state = snippy_reference_state()
+    if state != "current":
+        logger.warning("Warm-up: Snippy reference in %s is %s; jobs run full Snippy until "
+                       "scripts/00c_prepare_reference.sh is rerun", SNIPPY_REFERENCE_DIR, state)
+
+def run_warmup():
+    """Load everything a first request would otherwise pay for (blocking)"""
+    logger.info("Warm-up: api.app imported in %.2fs", IMPORT_SECONDS)
+    warmup.phases["import api.app"] = round(IMPORT_SECONDS, 4)
+    warmup.run(
+        # Plot and stage workers spawn and import in their own processes alongside the rest
+        [("plot workers", plot_pool.start)]
+        + ([("stage workers", stage_pool.start)] if stage_pool.enabled else [])
+        + [(f"import {module}", functools.partial(import_modules, [module])) for module in HEAVY_MODULES]
+        + [
+            ("models", registry.load_all),
+            ("explainers", registry.load_explainers),
+            ("templates", templates.load_all),
+            ("snippy reference", check_snippy_reference),
+            ("synthetic prediction", synthetic_prediction)
+        ]
+    )
+
+@app.on_event("startup")
+def claim_results_dir():
+    """Refuse to start beside another worker: /jobs lookups only see this process's jobs"""
+    job_store.claim()
+
+@app.on_event("startup")
+async def start_warmup():
+    """Warm up in the background so the server answers /health while it loads"""
+    app.state.warmup_task = asyncio.ensure_future(run_in_threadpool(run_warmup))
+
+async def _evict_expired_jobs():
+    while True:
+        await asyncio.sleep(60)
+        job_store.evict_expired()
+
+@app.on_event("startup")
+async def start_job_eviction():
+    app.state.eviction_task = asyncio.ensure_future(_evict_expired_jobs())
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    app.state.eviction_task.cancel()
+    for task in list(batch_tasks):
+        task.cancel()
+    await scheduler.shutdown()
+    plot_pool.shutdown()
+    stage_pool.shutdown()
 
 # Global exception handler
 @app.exception_handler(Exception)
@@ -59,36 +222,32 @@ async def global_exception_handler(request, exc):
         }
     )
 
-def get_shap_explanation(model, X, top_n=5):
-    """Extract top contributing features using SHAP"""
+def get_shap_values(entry, X):
+    """SHAP values of the resistant class for every row of X, plus the base value"""
+    try:
+        # Explainers are cached on the registry entry and rebuilt with the model
+        with STAGE_SECONDS.labels(stage="shap").time():
+            return entry.explainer().explain(X)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"SHAP analysis failed: {str(e)}")
+
+def get_shap_explanation(shap_row, template, top_n=5):
+    """Extract top contributing features from one row of SHAP values"""
     try:
-        explainer = shap.TreeExplainer(model)
-        shap_values = explainer.shap_values(X)
-        
-        if isinstance(shap_values, list):
-            shap_values = shap_values[1]
-        
         feature_impacts = pd.DataFrame({
-            'feature': X.columns,
-            'shap_value': shap_values[0]
+            'feature': template.features,
+            'shap_value': shap_row
         }).sort_values('shap_value', key=abs, ascending=False)
         
         evidence = []
-        for _, row in feature_impacts.head(top_n).iterrows():
+        for column, row in feature_impacts.head(top_n).iterrows():
             impact = row['shap_value']
             direction = "promotes_resistance" if impact > 0 else "promotes_susceptibility"
             
-            feat_name = row['feature']
-            if '>' in feat_name and 'NC_' in feat_name:
-                feat_type = "SNP"
-            elif len(feat_name) == 10 and feat_name.isalpha():
-                feat_type = "K-mer"
-            else:
-                feat_type = "Gene"
-            
             evidence.append({
-                "feature": feat_name,
-                "type": feat_type,
+                "feature": row['feature'],
+                # Typed once in the feature catalog
+                "type": template.type_label(column),
                 "impact_score": round(float(impact), 4),
                 "effect": direction
             })
@@ -97,52 +256,61 @@ def get_shap_explanation(model, X, top_n=5):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"SHAP analysis failed: {str(e)}")
 
-def create_force_plot(model, X, antibiotic):
-    """Generate SHAP force plot as base64 image"""
+def sparse_explanation(model_name, expected_value, shap_row, x_row, feature_names):
+    """What a force plot needs, keeping only features with a non-zero SHAP value"""
+    nonzero = np.flatnonzero(shap_row)
+    return {
+        "model": model_name,
+        "base_value": float(expected_value),
+        "features": [feature_names[i] for i in nonzero],
+        "values": x_row[nonzero].tolist(),
+        "shap_values": shap_row[nonzero].tolist()
+    }
+
+async def create_force_plot(explanation, antibiotic, fmt="png"):
+    """Render a SHAP force plot from a stored explanation in the plot pool; returns the image bytes"""
     try:
-        explainer = shap.TreeExplainer(model)
-        shap_values = explainer.shap_values(X)
-        
-        if isinstance(shap_values, list):
-            shap_values = shap_values[1]
-            expected_value = explainer.expected_value[1]
-        else:
-            expected_value = explainer.expected_value
-        
-        plt.figure(figsize=(14, 3))
-        shap.force_plot(
-            expected_value,
-            shap_values[0],
-            X.iloc[0],
-            matplotlib=True,
-            show=False,
-            text_rotation=10
-        )
-        plt.title(f"{antibiotic} - Feature Contributions", fontsize=14, fontweight='bold')
-        
-        buf = BytesIO()
-        plt.savefig(buf, format='png', dpi=150, bbox_inches='tight', facecolor='white')
-        plt.close()
-        buf.seek(0)
-        
-        img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-        return f"data:image/png;base64,{img_base64}"
+        with STAGE_SECONDS.labels(stage="plot").time():
+            return await asyncio.wrap_future(plot_pool.submit(explanation, antibiotic, fmt))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"SHAP visualization failed: {str(e)}")
 
+async def get_force_plot(explanation, antibiotic, fmt="png"):
+    """Cached force plot bytes"""
+    key = cache_key(antibiotic, fmt, json.dumps(explanation, sort_keys=True))
+    data = await run_in_threadpool(plot_cache.get_plot, key)
+    if data is None:
+        data = await create_force_plot(explanation, antibiotic, fmt)
+        await run_in_threadpool(plot_cache.put_plot, key, data)
+    return data
+
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
     try:
-        # Verify models exist
-        models_ok = all(p.exists() for p in MODELS.values())
+        # Verify models exist and are held in memory
+        models_ok = registry.loaded and all(p.exists() for p in MODELS.values())
         
-        return {
+        body = {
             "status": "healthy" if models_ok else "degraded",
             "version": "1.0.0",
             "models_loaded": models_ok,
+            "warmup": warmup.status(),
+            "models": registry.status(),
+            "jobs": scheduler.status(),
+            "result_cache": result_cache.status(),
+            "stage_cache": stage_cache.status(),
+            "plot_cache": plot_cache.status(),
+            "plot_workers": plot_pool.status(),
+            "stage_workers": stage_pool.status(),
+            "feature_catalog": templates.catalog.status() if templates.catalog else None,
             "timestamp": datetime.utcnow().isoformat() + "Z"
         }
+        if not warmup.ready:
+            # Not ready for traffic until models, explainers and templates are warm
+            body["status"] = "degraded" if warmup.state == "failed" else "starting"
+            return JSONResponse(status_code=503, content=body)
+        return body
     except Exception as e:
         return JSONResponse(
             status_code=503,
@@ -153,214 +321,681 @@ def health_check():
             }
         )
 
+def free_disk_mb(path):
+    """Free space on the filesystem holding path (or its nearest existing parent)"""
+    path = Path(path)
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    return shutil.disk_usage(path).free / (1024 * 1024)
+
+@app.get("/livez")
+def liveness():
+    """Liveness probe: the process is up and serving; restart it only if this fails"""
+    return {
+        "status": "alive",
+        "uptime_seconds": round(time.perf_counter() - _IMPORT_STARTED, 1),
+        "timestamp": datetime.utcnow().isoformat() + "Z"
+    }
+
+@app.get("/readyz")
+def readiness():
+    """Readiness probe: 503 while this worker cannot take another genome"""
+    tools = {tool: shutil.which(tool) for tool in REQUIRED_TOOLS}
+    free_mb = free_disk_mb(WORK_DIR)
+    jobs = scheduler.slots.status()
+    jobs["in_flight"] = scheduler.in_flight
+    jobs["saturated"] = scheduler.slots.saturated
+    checks = {
+        "warmup": warmup.ready,
+        "models": registry.loaded and all(p.exists() for p in MODELS.values()),
+        "tools": all(tools.values()),
+        "disk": free_mb >= MIN_FREE_DISK_MB,
+        # Same condition that makes /predict answer 429
+        "capacity": not jobs["saturated"]
+    }
+    ready = all(checks.values())
+    body = {
+        "status": "ready" if ready else "not_ready",
+        "checks": checks,
+        "tools": tools,
+        # Informational: without a current prepared reference jobs still run, with full Snippy
+        "snippy_reference": {"path": str(SNIPPY_REFERENCE_DIR), "state": snippy_reference_state()},
+        "disk": {"path": str(WORK_DIR), "free_mb": round(free_mb, 1), "min_free_mb": MIN_FREE_DISK_MB},
+        "jobs": jobs,
+        "models": registry.versions(),
+        "timestamp": datetime.utcnow().isoformat() + "Z"
+    }
+    if ready:
+        return body
+    return JSONResponse(status_code=503, content=body, headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics of the API process"""
+    return Response(content=generate_latest(metrics), media_type=CONTENT_TYPE_LATEST)
+
+ANTIBIOTICS = ["pefoxacin", "trimethoprim", "sulfamethoxazole"]
+
+def aligned_batch(feature_sets, model_name, template_name):
+    """Model, the genomes' features stacked in that model's column order, and the template"""
+    try:
+        entry = registry.get(model_name)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to load {model_name} model: {str(e)}"
+        )
+    template = templates.get(template_name)
+    if entry.feature_names is not None and entry.feature_names != template.features:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Feature template '{template_name}' does not match {model_name} model columns"
+        )
+    with STAGE_SECONDS.labels(stage="align").time():
+        X = stack([template.align(features.hits) for features in feature_sets])
+    return entry, X, template
+
+def consensus_call(proba_full, proba_partial):
+    """Combine full and partial model probabilities into one call"""
+    full_pred = "Resistant" if proba_full[1] >= 0.5 else "Susceptible"
+    partial_pred = "Resistant" if proba_partial[1] >= 0.5 else "Susceptible"
+    
+    if full_pred != partial_pred:
+        final_pred = full_pred if proba_full[1] > proba_partial[1] else partial_pred
+        final_prob = max(proba_full[1], proba_partial[1]) if final_pred == "Resistant" else max(proba_full[0], proba_partial[0])
+        confidence = "Low"
+        action = "CONFIRMATORY_AST_REQUIRED"
+        consensus = f"Models disagree: Full={full_pred} ({proba_full[1]:.1%}), Partial={partial_pred} ({proba_partial[1]:.1%})"
+    else:
+        final_pred = full_pred
+        if proba_full[1] > proba_partial[1]:
+            final_prob = proba_full[1] if final_pred == "Resistant" else proba_full[0]
+        else:
+            final_prob = proba_partial[1] if final_pred == "Resistant" else proba_partial[0]
+        
+        if final_prob >= 0.85:
+            confidence = "High"
+            action = "REPORT_FINAL"
+        elif final_prob >= 0.65:
+            confidence = "Medium"
+            action = "CONSIDER_CONFIRMATION"
+        else:
+            confidence = "Low"
+            action = "CONFIRMATORY_AST_REQUIRED"
+        
+        consensus = f"Both models agree ({final_prob:.1%} confident)"
+    
+    return {
+        "phenotype": final_pred,
+        "probability_score": round(float(final_prob), 4),
+        "confidence_category": confidence,
+        "action_required": action,
+        "consensus": consensus,
+        "model_breakdown": {
+            "full_model": {"prediction": full_pred, "probability": round(float(proba_full[1]), 4)},
+            "partial_model": {"prediction": partial_pred, "probability": round(float(proba_partial[1]), 4)}
+        }
+    }
+
+def predict_genomes(feature_sets):
+    """Predictions for each genome; every model is scored once over the stacked rows.
+
+    Returns (results, explanations): per genome, the prediction objects and
+    the sparse SHAP explanations plots are later drawn from.
+    """
+    results = [{} for _ in feature_sets]
+    explanations = [{} for _ in feature_sets]
+    
+    for antibiotic in ANTIBIOTICS:
+        entry_full, X_full, template_full = aligned_batch(feature_sets, f"{antibiotic}_full", "full")
+        entry_partial, X_partial, template_partial = aligned_batch(
+            feature_sets, f"{antibiotic}_partial", PARTIAL_TEMPLATES[antibiotic])
+        
+        with STAGE_SECONDS.labels(stage="predict_proba").time():
+            probas_full = entry_full.model.predict_proba(X_full)
+        with STAGE_SECONDS.labels(stage="predict_proba").time():
+            probas_partial = entry_partial.model.predict_proba(X_partial)
+        
+        # The model leaning harder towards resistance explains the call
+        use_full = probas_full[:, 1] > probas_partial[:, 1]
+        explained = {}
+        for pick, entry, X, template in ((True, entry_full, X_full, template_full),
+                                         (False, entry_partial, X_partial, template_partial)):
+            rows = np.flatnonzero(use_full == pick)
+            if len(rows) == 0:
+                continue
+            # One SHAP pass per model over the rows it explains, shared by evidence and plot
+            X_rows = X[rows]
+            shap_values, expected_value = get_shap_values(entry, X_rows)
+            X_dense = X_rows.toarray()
+            for j, i in enumerate(rows):
+                explained[i] = (entry.name, expected_value, shap_values[j], X_dense[j], template)
+        
+        for i in range(len(feature_sets)):
+            model_name, expected_value, shap_row, x_row, template = explained[i]
+            call = consensus_call(probas_full[i], probas_partial[i])
+            breakdown = call.pop("model_breakdown")
+            call["evidence"] = get_shap_explanation(shap_row, template, top_n=5)
+            # Plots are drawn on request (?plots=true or the plots endpoint)
+            call["shap_visualization"] = None
+            call["model_breakdown"] = breakdown
+            results[i][antibiotic] = call
+            explanations[i][antibiotic] = sparse_explanation(model_name, expected_value, shap_row, x_row, template.features)
+    
+    return results, explanations
+
+def _link_plots(predictions, job_id):
+    return {
+        antibiotic: dict(prediction, plot_url=f"/jobs/{job_id}/plots/{antibiotic}")
+        for antibiotic, prediction in predictions.items()
+    }
+
+def build_output(job, features, predictions):
+    """The /predict response for one genome"""
+    end_time = datetime.utcnow()
+    
+    output = {
+        "job_id": job.job_id,
+        "sample_id": features.genome_id,
+        "status": "completed",
+        "cached": False,
+        "timestamps": {
+            "submitted_at": job.submitted_at.isoformat() + "Z",
+            "completed_at": end_time.isoformat() + "Z",
+            "processing_time_seconds": int((end_time - job.submitted_at).total_seconds())
+        },
+        "quality_metrics": {
+            "genome_size_mb": round(job.file_size / (1024 * 1024), 2),
+            "genes_detected": features.counts["genes"],
+            "kmers_matched": features.counts["kmers"],
+            "snps_detected": features.counts["snps"]
+        },
+        "predictions": _link_plots(predictions, job.job_id),
+        "model_metadata": {
+            "pipeline_version": "1.0.0",
+            "trained_date": "2026-01-15",
+            "training_samples": 338,
+            "card_version": "2024.01",
+            "reference_genome": "Salmonella_Typhimurium_LT2"
+        }
+    }
+    
+    return output
+
+def score_genomes(jobs, feature_sets):
+    """Predict and explain extracted features (blocking; run in a worker thread)"""
+    predictions, explanations = predict_genomes(feature_sets)
+    outputs = [build_output(job, features, preds) for job, features, preds in zip(jobs, feature_sets, predictions)]
+    return outputs, explanations
+
+async def inline_plots(output, job):
+    """Copy of a job's output with base64 PNG force plots filled in"""
+    try:
+        explanations = await run_in_threadpool(job_store.load_explanations, job)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Explanations for job {job.job_id} have expired")
+    output = dict(output)
+    output["predictions"] = {antibiotic: dict(p) for antibiotic, p in output["predictions"].items()}
+    # One plot per antibiotic, rendered side by side in the pool
+    pngs = await asyncio.gather(*(
+        get_force_plot(explanations[antibiotic], antibiotic, "png") for antibiotic in output["predictions"]
+    ))
+    for prediction, png in zip(output["predictions"].values(), pngs):
+        prediction["shap_visualization"] = "data:image/png;base64," + base64.b64encode(png).decode('utf-8')
+    return output
+
+def validate_genome_name(filename):
+    if not filename.endswith(GENOME_EXTENSIONS):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid file format. Please upload .fna, .fasta, or .fa file"
+        )
+
+def validate_genome(filename, file_size):
+    """Reject uploads that cannot be a genome assembly"""
+    validate_genome_name(filename)
+    try:
+        check_size(file_size)
+    except InvalidGenome as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def spool_to_job(source, job_id):
+    """Stream a genome into a new job directory (blocking); (size, sha256).
+
+    The directory is removed again if the genome is rejected.
+    """
+    work_path = WORK_DIR / job_id
+    work_path.mkdir(parents=True, exist_ok=True)
+    try:
+        return spool_genome(source, work_path / GENOME_FILE)
+    except InvalidGenome as e:
+        shutil.rmtree(work_path, True)
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _complete_from_cache(job, cached):
+    """Finish job with a cached (result, explanations) pair; returns its output"""
+    result, explanations = cached
+    output = _cached_output(result, job)
+    job_store.add(job)
+    job.complete(await run_in_threadpool(job_store.save_result, job, output, explanations))
+    JOBS.labels(outcome="cached").inc()
+    return output
+
+def _cached_output(cached, job):
+    """Re-issue a cached prediction under the new job's id and timestamps"""
+    now = datetime.utcnow().isoformat() + "Z"
+    output = dict(cached)
+    output["job_id"] = job.job_id
+    output["cached"] = True
+    output["timestamps"] = {
+        "submitted_at": job.submitted_at.isoformat() + "Z",
+        "completed_at": now,
+        "processing_time_seconds": 0
+    }
+    output["predictions"] = _link_plots(cached["predictions"], job.job_id)
+    return output
+
+def stage_observer(job):
+    """on_stage callback: record progress on the job and stage timings in metrics"""
+    def on_stage(stage, state):
+        job.set_stage(stage, state)
+        if state == "completed":
+            STAGE_SECONDS.labels(stage=stage).observe(job.stages[stage]["seconds"])
+    return on_stage
+
+def _count_failed_stages(job, reason):
+    for stage, entry in job.stages.items():
+        if entry["status"] == "failed":
+            STAGE_FAILURES.labels(stage=stage, reason=reason).inc()
+
+async def extract_features(job, genome_sha256=None):
+    """Run the pipeline in the job's work directory and read back its hits"""
+    work_path = WORK_DIR / job.job_id
+    try:
+        await run_pipeline(work_path, on_stage=stage_observer(job),
+                           genome_sha256=genome_sha256, stage_cache=stage_cache, stage_pool=stage_pool)
+    except StageTimeout as e:
+        _count_failed_stages(job, "timeout")
+        raise HTTPException(
+            status_code=504,
+            detail=f"Pipeline timeout during {e.stage}"
+        )
+    except StageError as e:
+        _count_failed_stages(job, "error")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Pipeline failed: {e.stderr[:200]}"
+        )
+    
+    try:
+        return await run_in_threadpool(read_genome_features, work_path)
+    except FileNotFoundError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Feature extraction incomplete: {str(e)}"
+        )
+
+async def finish_jobs(jobs, feature_sets, result_keys):
+    """Score extracted genomes together, then store and complete each job"""
+    for job in jobs:
+        job.set_stage("predict", "running")
+    outputs, explanations = await run_in_threadpool(score_genomes, jobs, feature_sets)
+    
+    for job, output, explained, result_key in zip(jobs, outputs, explanations, result_keys):
+        job.set_stage("predict", "completed")
+        result_path = await run_in_threadpool(job_store.save_result, job, output, explained)
+        if result_key is not None:
+            await run_in_threadpool(result_cache.put_result, result_key, output, explained)
+        job.complete(result_path)
+        JOBS.labels(outcome="completed").inc()
+        JOB_SECONDS.observe((job.completed_at - job.submitted_at).total_seconds())
+    return outputs
+
+def _fail_job(job, exc):
+    if job.finished:
+        return
+    JOBS.labels(outcome="failed").inc()
+    if isinstance(exc, HTTPException):
+        job.fail(exc.status_code, exc.detail)
+    else:
+        job.fail(500, f"Unexpected error: {str(exc)}\n{traceback.format_exc()[:500]}")
+
+async def _remove_work_dir(job):
+    work_path = WORK_DIR / job.job_id
+    if work_path.exists():
+        await run_in_threadpool(shutil.rmtree, work_path, True)
+
+async def run_prediction_job(job, result_key=None, genome_sha256=None):
+    """Pipeline + scoring for one job; records the outcome on the job"""
+    try:
+        features = await extract_features(job, genome_sha256)
+        outputs = await finish_jobs([job], [features], [result_key])
+        return outputs[0]
+    except Exception as e:
+        _fail_job(job, e)
+    finally:
+        await _remove_work_dir(job)
+
+async def run_extraction_job(job, genome_sha256=None):
+    """Pipeline only, for batch members; the batch scores them together"""
+    try:
+        return await extract_features(job, genome_sha256)
+    except Exception as e:
+        _fail_job(job, e)
+    finally:
+        await _remove_work_dir(job)
+
+def server_busy(running, queued):
+    return HTTPException(
+        status_code=429,
+        detail=f"Server busy: {running} jobs running and {queued} queued. Retry later",
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+    )
+
+async def submit_job(genome):
+    """Validate an upload, then answer it from cache or queue it.
+
+    Returns (job, task); on a cache hit the job is already completed and
+    task is a resolved future holding the response.
+    """
+    validate_genome_name(genome.filename)
+    # Turn a saturated replica's requests away before copying the upload;
+    # scheduler.submit() below remains the authoritative check
+    if scheduler.slots.saturated:
+        raise server_busy(scheduler.slots.running, scheduler.slots.queued)
+    job_id = str(uuid.uuid4())[:8]
+    work_path = WORK_DIR / job_id
+    # Streamed into the job directory in chunks, hashed and checked on the way,
+    # so neither queued nor running jobs hold the upload in memory
+    size, genome_sha256 = await run_in_threadpool(spool_to_job, genome.file, job_id)
+    job = Job(job_id, genome.filename, size)
+    
+    # Same bytes + same models/templates/references => same prediction
+    result_key = cache_key(genome_sha256, await run_in_threadpool(input_versions.fingerprint))
+    cached = await run_in_threadpool(result_cache.get_result, result_key)
+    if cached is not None:
+        await run_in_threadpool(shutil.rmtree, work_path, True)
+        output = await _complete_from_cache(job, cached)
+        task = asyncio.get_event_loop().create_future()
+        task.set_result(output)
+        return job, task
+    
+    try:
+        task = scheduler.submit(job, functools.partial(
+            run_prediction_job, result_key=result_key, genome_sha256=genome_sha256
+        ))
+    except QueueFull as e:
+        await run_in_threadpool(shutil.rmtree, work_path, True)
+        raise server_busy(e.running, e.queued)
+    return job, task
+
 @app.post("/predict")
-async def predict_resistance(genome: UploadFile = File(...)):
+async def predict_resistance(genome: UploadFile = File(...), plots: bool = False):
     """
     Predict antibiotic resistance for Salmonella genome.
     
     Args:
         genome: FASTA/FNA file (assembled genome, 1MB-10MB)
+        plots: inline base64 force plots (otherwise fetch them from plot_url)
     
     Returns:
         JSON with predictions for pefoxacin, trimethoprim, sulfamethoxazole
     """
-    job_id = str(uuid.uuid4())[:8]
-    work_path = WORK_DIR / job_id
+    job, task = await submit_job(genome)
     
+    # Shielded so a dropped connection does not kill a job others may poll
+    output = await asyncio.shield(task)
+    if job.status == "failed":
+        raise HTTPException(status_code=job.error["status_code"], detail=job.error["detail"])
+    if plots:
+        output = await inline_plots(output, job)
+    return output
+
+def _validate_batch_entry(filename, file_size):
     try:
-        # Validate file format
-        if not genome.filename.endswith(('.fna', '.fasta', '.fa')):
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid file format. Please upload .fna, .fasta, or .fa file"
-            )
-        
-        # Read and validate file size
-        content = await genome.read()
-        file_size = len(content)
-        
-        if file_size > 10 * 1024 * 1024:  # 10MB
-            raise HTTPException(
-                status_code=400,
-                detail="File too large. Maximum size is 10MB"
-            )
-        
-        if file_size < 1000:  # 1KB minimum
-            raise HTTPException(
-                status_code=400,
-                detail="File too small. Please upload a valid genome assembly"
-            )
-        
-        # Create work directory
-        work_path.mkdir(parents=True, exist_ok=True)
-        start_time = datetime.utcnow()
-        
-        # Save genome
-        genome_path = work_path / "query_genome.fna"
-        with open(genome_path, "wb") as f:
-            f.write(content)
-        
-        # Run pipeline
-        os.chdir(work_path)
-        
-        try:
-            subprocess.run(["bash", f"{SCRIPTS_DIR}/01_extract_genes.sh"], 
-                          check=True, capture_output=True, timeout=300)
-            subprocess.run(["python3", f"{SCRIPTS_DIR}/01b_process_genes.py"], 
-                          check=True, capture_output=True, timeout=60)
-            subprocess.run(["bash", f"{SCRIPTS_DIR}/02_create_blast_db.sh"], 
-                          check=True, capture_output=True, timeout=60)
-            subprocess.run(["python3", f"{SCRIPTS_DIR}/03_extract_kmers.py"], 
-                          check=True, capture_output=True, timeout=600)
-            subprocess.run(["bash", f"{SCRIPTS_DIR}/04_extract_snps.sh"], 
-                          check=True, capture_output=True, timeout=600)
-            subprocess.run(["python3", f"{SCRIPTS_DIR}/04b_process_snps.py"], 
-                          check=True, capture_output=True, timeout=60)
-            subprocess.run(["python3", f"{SCRIPTS_DIR}/06_align_features.py"], 
-                          check=True, capture_output=True, timeout=60)
-        except subprocess.TimeoutExpired as e:
-            raise HTTPException(
-                status_code=504,
-                detail=f"Pipeline timeout during {e.cmd[1].split('/')[-1]}"
-            )
-        except subprocess.CalledProcessError as e:
-            error_msg = e.stderr.decode() if e.stderr else "Unknown error"
-            raise HTTPException(
-                status_code=500,
-                detail=f"Pipeline failed: {error_msg[:200]}"
-            )
-        
-        # Load features
-        try:
-            df_full = pd.read_csv(work_path / "aligned_full.csv")
-            df_snps_kmers = pd.read_csv(work_path / "aligned_snps_kmers.csv")
-            df_genes_snps = pd.read_csv(work_path / "aligned_genes_snps.csv")
-            genes_df = pd.read_csv(work_path / "gene_presence_production.csv")
-            kmers_df = pd.read_csv(work_path / "kmer_production.csv")
-            snps_df = pd.read_csv(work_path / "snp_production.csv")
-        except FileNotFoundError as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Feature extraction incomplete: {str(e)}"
-            )
-        
-        genome_id = df_full['Genome_ID'].iloc[0]
-        X_full = df_full.drop(columns=['Genome_ID'])
-        X_snps_kmers = df_snps_kmers.drop(columns=['Genome_ID'])
-        X_genes_snps = df_genes_snps.drop(columns=['Genome_ID'])
-        
-        # Predict with SHAP
-        results = {}
-        
-        for antibiotic in ["pefoxacin", "trimethoprim", "sulfamethoxazole"]:
-            try:
-                with open(MODELS[f"{antibiotic}_full"], 'rb') as f:
-                    model_full = pickle.load(f)
-                with open(MODELS[f"{antibiotic}_partial"], 'rb') as f:
-                    model_partial = pickle.load(f)
-            except Exception as e:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Failed to load {antibiotic} models: {str(e)}"
-                )
-            
-            X_partial = X_snps_kmers if antibiotic in ["pefoxacin", "trimethoprim"] else X_genes_snps
-            
-            proba_full = model_full.predict_proba(X_full)[0]
-            proba_partial = model_partial.predict_proba(X_partial)[0]
-            
-            full_pred = "Resistant" if proba_full[1] >= 0.5 else "Susceptible"
-            partial_pred = "Resistant" if proba_partial[1] >= 0.5 else "Susceptible"
-            
-            if full_pred != partial_pred:
-                final_pred = full_pred if proba_full[1] > proba_partial[1] else partial_pred
-                final_prob = max(proba_full[1], proba_partial[1]) if final_pred == "Resistant" else max(proba_full[0], proba_partial[0])
-                confidence = "Low"
-                action = "CONFIRMATORY_AST_REQUIRED"
-                consensus = f"Models disagree: Full={full_pred} ({proba_full[1]:.1%}), Partial={partial_pred} ({proba_partial[1]:.1%})"
-                best_model = model_full if proba_full[1] > proba_partial[1] else model_partial
-                best_X = X_full if proba_full[1] > proba_partial[1] else X_partial
+        validate_genome(filename, file_size)
+    except HTTPException as e:
+        raise HTTPException(status_code=e.status_code, detail=f"{filename}: {e.detail}")
+
+def _spool_batch_entry(source, filename, spooled):
+    """Stream one batch genome into a new job directory; appends (job_id, filename, size, sha256)"""
+    if len(spooled) == MAX_BATCH_GENOMES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many genomes in batch. Maximum is {MAX_BATCH_GENOMES}"
+        )
+    job_id = str(uuid.uuid4())[:8]
+    try:
+        validate_genome_name(filename)
+        size, genome_sha256 = spool_to_job(source, job_id)
+    except HTTPException as e:
+        raise HTTPException(status_code=e.status_code, detail=f"{filename}: {e.detail}")
+    spooled.append((job_id, filename, size, genome_sha256))
+
+def _spool_tarball(filename, fileobj, spooled):
+    """Stream every FASTA member of an uploaded tarball into its own job directory"""
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r:*") as tar:
+            for member in tar:
+                name = os.path.basename(member.name)
+                # Skip directories and editor/OS droppings such as macOS ._ files
+                if not member.isfile() or name.startswith('.') or not name.endswith(GENOME_EXTENSIONS):
+                    continue
+                _validate_batch_entry(name, member.size)
+                _spool_batch_entry(tar.extractfile(member), name, spooled)
+    except tarfile.TarError as e:
+        raise HTTPException(status_code=400, detail=f"Unreadable tarball {filename}: {str(e)}")
+
+def spool_batch(uploads):
+    """Stream every genome of a batch upload to disk (blocking); [(job_id, filename, size, sha256)].
+
+    If any genome is rejected, those already spooled are removed again.
+    """
+    spooled = []
+    try:
+        for upload in uploads:
+            if upload.filename.endswith(TARBALL_EXTENSIONS):
+                _spool_tarball(upload.filename, upload.file, spooled)
             else:
-                final_pred = full_pred
-                if proba_full[1] > proba_partial[1]:
-                    final_prob = proba_full[1] if final_pred == "Resistant" else proba_full[0]
-                    best_model = model_full
-                    best_X = X_full
-                else:
-                    final_prob = proba_partial[1] if final_pred == "Resistant" else proba_partial[0]
-                    best_model = model_partial
-                    best_X = X_partial
-                
-                if final_prob >= 0.85:
-                    confidence = "High"
-                    action = "REPORT_FINAL"
-                elif final_prob >= 0.65:
-                    confidence = "Medium"
-                    action = "CONSIDER_CONFIRMATION"
+                _spool_batch_entry(upload.file, upload.filename, spooled)
+    except Exception:
+        for job_id, _, _, _ in spooled:
+            shutil.rmtree(WORK_DIR / job_id, True)
+        raise
+    return spooled
+
+def _batch_line(job, output=None):
+    """One NDJSON line of a batch response"""
+    if output is not None:
+        line = {"filename": job.filename}
+        line.update(output)
+        return line
+    return {"job_id": job.job_id, "filename": job.filename, "status": job.status, "error": job.error}
+
+async def run_batch(batch_id, jobs, pending, lines):
+    """Score batch genomes as their extraction finishes; put one line per genome on lines.
+
+    Genomes whose pipelines finish while a previous group is being scored
+    are stacked and scored together, so each model runs once per group
+    rather than once per genome. Jobs stay pollable at /jobs/{job_id} even
+    if the client stops reading the stream.
+    """
+    try:
+        while pending:
+            finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            ready = []
+            for task in finished:
+                job, result_key = pending.pop(task)
+                features = None if task.cancelled() else task.result()
+                if features is None:
+                    lines.put_nowait(_batch_line(job))
                 else:
-                    confidence = "Low"
-                    action = "CONFIRMATORY_AST_REQUIRED"
-                
-                consensus = f"Both models agree ({final_prob:.1%} confident)"
-            
-            evidence = get_shap_explanation(best_model, best_X, top_n=5)
-            force_plot = create_force_plot(best_model, best_X, antibiotic.capitalize())
-            
-            results[antibiotic] = {
-                "phenotype": final_pred,
-                "probability_score": round(float(final_prob), 4),
-                "confidence_category": confidence,
-                "action_required": action,
-                "consensus": consensus,
-                "evidence": evidence,
-                "shap_visualization": force_plot,
-                "model_breakdown": {
-                    "full_model": {"prediction": full_pred, "probability": round(float(proba_full[1]), 4)},
-                    "partial_model": {"prediction": partial_pred, "probability": round(float(proba_partial[1]), 4)}
-                }
-            }
-        
-        end_time = datetime.utcnow()
+                    ready.append((job, features, result_key))
+            if not ready:
+                continue
+            ready_jobs = [job for job, _, _ in ready]
+            try:
+                outputs = await finish_jobs(ready_jobs, [f for _, f, _ in ready], [k for _, _, k in ready])
+            except Exception as e:
+                for job in ready_jobs:
+                    _fail_job(job, e)
+                outputs = [None] * len(ready_jobs)
+            for job, output in zip(ready_jobs, outputs):
+                lines.put_nowait(_batch_line(job, output))
+    finally:
+        lines.put_nowait({
+            "batch_id": batch_id,
+            "status": "finished",
+            "completed": sum(1 for job in jobs if job.status == "completed"),
+            "failed": sum(1 for job in jobs if job.status != "completed")
+        })
+        lines.put_nowait(None)
+
+@app.post("/predict/batch")
+async def predict_batch(genomes: List[UploadFile] = File(...), plots: bool = False):
+    """
+    Predict antibiotic resistance for many genomes in one request.
+    
+    Args:
+        genomes: FASTA/FNA files and/or .tar(.gz) archives of them
+        plots: inline base64 force plots in each result
+    
+    Returns:
+        NDJSON stream: a header listing the job ids, one /predict-style result
+        (or error) per genome as it finishes, and a closing summary line
+    """
+    entries = await run_in_threadpool(spool_batch, genomes)
+    if not entries:
+        raise HTTPException(status_code=400, detail="No genomes found in batch upload")
+    
+    batch_id = str(uuid.uuid4())[:8]
+    fingerprint = await run_in_threadpool(input_versions.fingerprint)
+    lines = asyncio.Queue()
+    jobs = []
+    pending = {}
+    for job_id, filename, size, genome_sha256 in entries:
+        job = Job(job_id, filename, size)
+        jobs.append(job)
+        result_key = cache_key(genome_sha256, fingerprint)
+        cached = await run_in_threadpool(result_cache.get_result, result_key)
+        if cached is not None:
+            await run_in_threadpool(shutil.rmtree, WORK_DIR / job_id, True)
+            output = await _complete_from_cache(job, cached)
+            lines.put_nowait(_batch_line(job, output))
+            continue
         
-        output = {
+        # Batch members wait for pipeline slots rather than being turned away
+        task = scheduler.submit(job, functools.partial(
+            run_extraction_job, genome_sha256=genome_sha256
+        ), bounded=False)
+        pending[task] = (job, result_key)
+    
+    coordinator = asyncio.ensure_future(run_batch(batch_id, jobs, pending, lines))
+    batch_tasks.add(coordinator)
+    coordinator.add_done_callback(batch_tasks.discard)
+    
+    header = {
+        "batch_id": batch_id,
+        "genomes": len(jobs),
+        "jobs": [{"job_id": job.job_id, "filename": job.filename} for job in jobs]
+    }
+    
+    by_id = {job.job_id: job for job in jobs}
+    
+    async def stream():
+        yield json.dumps(header) + "\n"
+        while True:
+            line = await lines.get()
+            if line is None:
+                return
+            if plots and "predictions" in line:
+                line = await inline_plots(line, by_id[line["job_id"]])
+            yield json.dumps(line) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_job(genome: UploadFile = File(...)):
+    """
+    Submit a genome for background prediction.
+    
+    Returns immediately with a job_id; poll GET /jobs/{job_id} for progress.
+    """
+    job, _ = await submit_job(genome)
+    body = job.to_dict()
+    body["queue_position"] = scheduler.queue_position(job.job_id)
+    body["links"] = {"self": f"/jobs/{job.job_id}"}
+    return body
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0, plots: bool = False):
+    """
+    Job status with per-stage progress; includes the result once completed.
+    
+    Args:
+        wait: long-poll for up to this many seconds (max 60) until the job changes
+        plots: inline base64 force plots in the result
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+    
+    if wait > 0:
+        await job.wait_changed(min(wait, MAX_POLL_WAIT_SECONDS))
+    
+    body = job.to_dict()
+    body["queue_position"] = scheduler.queue_position(job_id)
+    if job.status == "completed":
+        try:
+            body["result"] = await run_in_threadpool(job_store.load_result, job)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Result for job {job_id} has expired")
+        if plots:
+            body["result"] = await inline_plots(body["result"], job)
+    return body
+
+@app.get("/jobs/{job_id}/plots/{antibiotic}")
+async def get_job_plot(job_id: str, antibiotic: str, format: str = "png"):
+    """
+    SHAP force plot for one antibiotic of a completed job.
+    
+    Args:
+        format: png or svg image, or json with the raw values to draw client-side
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.status}")
+    if antibiotic not in ANTIBIOTICS:
+        raise HTTPException(status_code=404, detail=f"Unknown antibiotic: {antibiotic}")
+    if format != "json" and format not in PLOT_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format. Use png, svg or json")
+    
+    try:
+        explanation = (await run_in_threadpool(job_store.load_explanations, job))[antibiotic]
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Explanations for job {job_id} have expired")
+    
+    if format == "json":
+        order = sorted(range(len(explanation["features"])), key=lambda i: -abs(explanation["shap_values"][i]))
+        return {
             "job_id": job_id,
-            "sample_id": genome_id,
-            "status": "completed",
-            "timestamps": {
-                "submitted_at": start_time.isoformat() + "Z",
-                "completed_at": end_time.isoformat() + "Z",
-                "processing_time_seconds": int((end_time - start_time).total_seconds())
-            },
-            "quality_metrics": {
-                "genome_size_mb": round(file_size / (1024 * 1024), 2),
-                "genes_detected": int(genes_df.shape[1] - 1),
-                "kmers_matched": int(kmers_df.shape[1] - 1),
-                "snps_detected": int(snps_df.shape[1] - 1)
-            },
-            "predictions": results,
-            "model_metadata": {
-                "pipeline_version": "1.0.0",
-                "trained_date": "2026-01-15",
-                "training_samples": 338,
-                "card_version": "2024.01",
-                "reference_genome": "Salmonella_Typhimurium_LT2"
-            }
+            "antibiotic": antibiotic,
+            "model": explanation["model"],
+            "base_value": explanation["base_value"],
+            "features": [
+                {
+                    "feature": explanation["features"][i],
+                    "value": explanation["values"][i],
+                    "shap_value": explanation["shap_values"][i]
+                }
+                for i in order
+            ]
         }
-        
-        # Cleanup
-        shutil.rmtree(work_path)
-        
-        return output
     
-    except HTTPException:
-        raise
-    except Exception as e:
-        if work_path.exists():
-            shutil.rmtree(work_path)
-        raise HTTPException(
-            status_code=500,
-            detail=f"Unexpected error: {str(e)}\n{traceback.format_exc()[:500]}"
-        )
+    data = await get_force_plot(explanation, antibiotic, format)
+    return Response(content=data, media_type=PLOT_FORMATS[format])
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,246 @@
+"""Content-addressed on-disk caches for pipeline results."""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class InputVersions:
+    """
+    Fingerprint of every file besides the genome that shapes a prediction:
+    model pickles, feature templates, the CARD protein set, the reference
+    and the pipeline scripts.
+
+    Content hashes are recomputed only when a file's size or mtime changes,
+    so fingerprint() costs one stat per file on the request path. globs are
+    (directory, pattern) pairs listed on every call, so files added to such
+    a directory (e.g. a new feature template) change the fingerprint too.
+    """
+
+    def __init__(self, paths, salt="", globs=()):
+        self.paths = sorted(str(p) for p in paths)
+        self.salt = salt
+        self.globs = [(Path(directory), pattern) for directory, pattern in globs]
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def _digest(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return "missing"
+        stamp = (st.st_size, st.st_mtime_ns)
+        cached = self._digests.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        digest = file_sha256(path)
+        with self._lock:
+            self._digests[path] = (stamp, digest)
+        return digest
+
+    def current_paths(self):
+        globbed = {str(p) for directory, pattern in self.globs for p in directory.glob(pattern)}
+        return sorted(set(self.paths) | globbed)
+
+    def digests(self):
+        return {path: self._digest(path) for path in self.current_paths()}
+
+    def fingerprint(self):
+        h = hashlib.sha256(self.salt.encode())
+        for path, digest in self.digests().items():
+            h.update(f"{path}\0{digest}\n".encode())
+        return h.hexdigest()
+
+
+def cache_key(*parts):
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+class DiskLRUCache:
+    """
+    Directory-per-entry cache under root, bounded to max_bytes.
+
+    Recency is tracked in memory and mirrored in each entry's mtime so the
+    LRU order survives restarts. Safe to call from worker threads.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if self.enabled:
+            self._scan()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _scan(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        found = []
+        for entry in self.root.iterdir():
+            if not entry.is_dir() or entry.name.startswith("."):
+                continue
+            size = sum(f.stat().st_size for f in entry.rglob("*") if f.is_file())
+            found.append((entry.stat().st_mtime, entry.name, size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._bytes += size
+
+    def get(self, key):
+        """Return the entry directory for key, or None on a miss"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        path = self.root / key
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.vanished(key)
+            return None
+        return path
+
+    def vanished(self, key):
+        """Forget an entry removed behind our back (e.g. by another worker's eviction); its hit becomes a miss"""
+        with self._lock:
+            self._bytes -= self._entries.pop(key, 0)
+            self.hits -= 1
+            self.misses += 1
+        # Drop whatever part of it is left, so a later put() can store it again
+        shutil.rmtree(self.root / key, ignore_errors=True)
+
+    def put(self, key, fill):
+        """Create the entry for key; fill(tmp_dir) writes its files"""
+        if not self.enabled:
+            return
+        tmp = self.root / f".tmp-{uuid.uuid4().hex}"
+        tmp.mkdir(parents=True)
+        try:
+            fill(tmp)
+            size = sum(f.stat().st_size for f in tmp.rglob("*") if f.is_file())
+            with self._lock:
+                if key in self._entries:
+                    return
+                try:
+                    os.replace(tmp, self.root / key)
+                except OSError:
+                    # Another worker process stored the same entry first
+                    pass
+                self._entries[key] = size
+                self._bytes += size
+                self._evict()
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            shutil.rmtree(self.root / key, ignore_errors=True)
+
+    def status(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "size_mb": round(self._bytes / (1024 * 1024), 2),
+            "max_size_mb": round(self.max_bytes / (1024 * 1024), 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None
+        }
+
+
+class ResultCache(DiskLRUCache):
+    """Whole prediction responses keyed by genome hash + input fingerprint"""
+
+    def get_result(self, key):
+        """(result, explanations) for key, or None on a miss"""
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            with open(path / "result.json") as f:
+                result = json.load(f)
+            with open(path / "explanations.json") as f:
+                explanations = json.load(f)
+        except FileNotFoundError:
+            self.vanished(key)
+            return None
+        return result, explanations
+
+    def put_result(self, key, result, explanations):
+        def fill(tmp):
+            with open(tmp / "result.json", "w") as f:
+                json.dump(result, f)
+            with open(tmp / "explanations.json", "w") as f:
+                json.dump(explanations, f)
+        self.put(key, fill)
+
+
+class PlotCache(DiskLRUCache):
+    """Rendered SHAP plots keyed by the explanation they draw and the format"""
+
+    def get_plot(self, key):
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            return (path / "plot").read_bytes()
+        except FileNotFoundError:
+            self.vanished(key)
+            return None
+
+    def put_plot(self, key, data):
+        self.put(key, lambda tmp: (tmp / "plot").write_bytes(data))
+
+
+class StageCache(DiskLRUCache):
+    """Output files of individual pipeline stages, keyed by genome + stage config"""
+
+    def restore(self, key, work_path, outputs):
+        """Copy a cached stage's outputs into work_path; False on a miss"""
+        path = self.get(key)
+        if path is None:
+            return False
+        try:
+            for rel in outputs:
+                dest = Path(work_path) / rel
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(path / rel, dest)
+        except FileNotFoundError:
+            self.vanished(key)
+            return False
+        return True
+
+    def store(self, key, work_path, outputs):
+        def fill(tmp):
+            for rel in outputs:
+                dest = tmp / rel
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(Path(work_path) / rel, dest)
+        self.put(key, fill)
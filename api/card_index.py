@@ -0,0 +1,138 @@
+"""Precomputed resistance gene -> CARD protein index for the tBLASTn query set."""
+import hashlib
+import json
+import os
+import re
+import uuid
+
+MAX_PROTEINS_PER_GENE = 3
+
+
+def normalize_gene_name(gene):
+    normalized = re.sub(r'^(bla|BLA)', '', gene)
+    normalized = re.sub(r'_\d+$', '', normalized)
+    return normalized.upper()
+
+
+def gene_patterns(gene):
+    """Regexes that tie an ABRicate gene name to a CARD protein description"""
+    gene_norm = normalize_gene_name(gene)
+    patterns = [rf'\b{re.escape(gene)}\b', rf'\b{re.escape(gene_norm)}\b']
+    if '(' in gene:
+        no_parens = gene.replace('(', '').replace(')', '').replace("'", '')
+        patterns.append(rf'\b{re.escape(no_parens)}\b')
+    return [re.compile(p, re.IGNORECASE) for p in patterns]
+
+
+def read_fasta_blocks(path):
+    """(description, raw record text) for every record, in file order"""
+    records = []
+    header, lines = None, []
+    with open(path) as f:
+        for line in f:
+            if line.startswith('>'):
+                if header is not None:
+                    records.append((header, ''.join(lines)))
+                header, lines = line[1:].rstrip(), [line]
+            elif header is not None:
+                lines.append(line if line.endswith('\n') else line + '\n')
+    if header is not None:
+        records.append((header, ''.join(lines)))
+    return records
+
+
+class CardIndex:
+    """
+    Maps each gene name to the first MAX_PROTEINS_PER_GENE CARD records
+    whose description matches it, persisted as JSON under index_dir.
+
+    Genes are resolved by regex scan the first time they are seen (or in
+    bulk by 00a_build_card_index.py at image build) and looked up afterwards.
+    Query FASTAs are assembled from the records held in memory into the
+    caller's (job) directory, so nothing per genome accumulates under
+    index_dir. The index is tied to the CARD file's hash and rebuilt if the
+    file changes.
+    """
+
+    def __init__(self, card_file, index_dir):
+        self.card_file = card_file
+        self.index_dir = index_dir
+        self.index_file = os.path.join(index_dir, "card_gene_index.json")
+        self._records = None
+        self._card_sha256 = None
+        self._genes = None
+
+    @property
+    def card_sha256(self):
+        if self._card_sha256 is None:
+            h = hashlib.sha256()
+            with open(self.card_file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(chunk)
+            self._card_sha256 = h.hexdigest()
+        return self._card_sha256
+
+    @property
+    def records(self):
+        if self._records is None:
+            self._records = read_fasta_blocks(self.card_file)
+        return self._records
+
+    @property
+    def genes(self):
+        if self._genes is None:
+            self._genes = {}
+            try:
+                with open(self.index_file) as f:
+                    data = json.load(f)
+                if data.get("card_sha256") == self.card_sha256 and \
+                        data.get("max_proteins_per_gene") == MAX_PROTEINS_PER_GENE:
+                    self._genes = data["genes"]
+            except (FileNotFoundError, ValueError):
+                pass
+        return self._genes
+
+    def _scan(self, gene):
+        patterns = gene_patterns(gene)
+        hits = []
+        for i, (description, _) in enumerate(self.records):
+            if any(p.search(description) for p in patterns):
+                hits.append(i)
+                if len(hits) == MAX_PROTEINS_PER_GENE:
+                    break
+        return hits
+
+    def _atomic_write(self, path, text):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def resolve(self, genes):
+        """Ensure every gene is indexed; returns how many had to be scanned"""
+        missing = [g for g in dict.fromkeys(genes) if g not in self.genes]
+        for gene in missing:
+            self.genes[gene] = self._scan(gene)
+        if missing:
+            self._atomic_write(self.index_file, json.dumps({
+                "card_sha256": self.card_sha256,
+                "max_proteins_per_gene": MAX_PROTEINS_PER_GENE,
+                "genes": self.genes
+            }))
+        return len(missing)
+
+    def query_set(self, genes, path):
+        """
+        Write the query FASTA for an ordered gene list to path.
+
+        Records come out in CARD file order, repeated once per matching gene,
+        exactly as the original per-record regex scan emitted them.
+        Returns (fasta_path, matched_gene_count, protein_count).
+        """
+        self.resolve(genes)
+        pairs = sorted((i, pos) for pos, gene in enumerate(genes) for i in self.genes[gene])
+        matched = sum(1 for gene in dict.fromkeys(genes) if self.genes[gene])
+        with open(path, 'w') as f:
+            f.write(''.join(self.records[i][1] for i, _ in pairs))
+        return path, matched, len(pairs)
@@ -0,0 +1,161 @@
+"""Compiled feature catalog: id, type and per-template column of every template feature."""
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+GENE, KMER, SNP = 0, 1, 2
+# Feature types as reported in prediction evidence
+TYPE_LABELS = ("Gene", "K-mer", "SNP")
+
+KMER_SIZE = 10
+CATALOG_VERSION = 1
+
+# Generated data, kept with the other caches rather than beside the templates
+CATALOG_DIR = Path(os.getenv('FEATURE_CATALOG_DIR') or Path(os.getenv('CACHE_DIR', '/app/cache')) / "catalog")
+
+
+def classify(feat):
+    """Type of a feature name; only used when compiling the catalog"""
+    if '>' in feat and feat.startswith('NC_'):
+        return SNP
+    if len(feat) == KMER_SIZE and feat.isalpha() and feat.isupper():
+        return KMER
+    return GENE
+
+
+def template_files(templates_dir):
+    return sorted(f for f in os.listdir(templates_dir) if f.endswith('.txt'))
+
+
+def templates_signature(templates_dir):
+    """[file, size, mtime_ns] per template; a changed template means a new catalog"""
+    signature = []
+    for filename in template_files(templates_dir):
+        st = os.stat(os.path.join(templates_dir, filename))
+        signature.append([filename, st.st_size, st.st_mtime_ns])
+    return signature
+
+
+def build(templates_dir, catalog_dir=None):
+    """
+    Compile the templates into catalog_dir/<signature key>/ unless already
+    there; returns that directory.
+
+    Features are stored sorted by name, so a feature's id is its position in
+    names.npy and lookups are a binary search. Each template is stored as its
+    column -> id array. The directory is written under a temporary name and
+    renamed into place, so concurrent builders and readers never see half a
+    catalog. Afterwards, older catalogs compiled from the same templates_dir
+    are removed; catalog_dir may be shared with other templates dirs, whose
+    catalogs are left alone.
+    """
+    catalog_dir = Path(catalog_dir or CATALOG_DIR)
+    signature = templates_signature(templates_dir)
+    key = hashlib.sha256(json.dumps([CATALOG_VERSION, signature]).encode()).hexdigest()[:16]
+    path = catalog_dir / key
+    if (path / "meta.json").exists():
+        return path
+
+    templates = {}
+    for filename, _, _ in signature:
+        with open(os.path.join(templates_dir, filename)) as f:
+            templates[filename] = [line.strip() for line in f if line.strip()]
+    names = sorted({feat for features in templates.values() for feat in features})
+    width = max((len(feat.encode()) for feat in names), default=1)
+    names_array = np.array([feat.encode() for feat in names], dtype=f"S{width}")
+
+    catalog_dir.mkdir(parents=True, exist_ok=True)
+    tmp = catalog_dir / f".{key}.{uuid.uuid4().hex}.tmp"
+    tmp.mkdir()
+    np.save(tmp / "names.npy", names_array)
+    np.save(tmp / "types.npy", np.array([classify(feat) for feat in names], dtype=np.uint8))
+    for filename, features in templates.items():
+        ids = np.searchsorted(names_array, np.array([feat.encode() for feat in features], dtype=names_array.dtype))
+        np.save(tmp / f"{Path(filename).stem}.npy", ids.astype(np.int32))
+    source = os.path.realpath(templates_dir)
+    with open(tmp / "meta.json", "w") as f:
+        json.dump({
+            "version": CATALOG_VERSION,
+            "templates_dir": source,
+            "templates_signature": signature,
+            "features": len(names),
+            "templates": {filename: len(features) for filename, features in templates.items()}
+        }, f)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # Another process finished the same catalog first
+        shutil.rmtree(tmp, ignore_errors=True)
+    built = (path / "meta.json").stat().st_mtime_ns
+    for old in catalog_dir.iterdir():
+        if old.name == path.name or old.name.startswith("."):
+            continue
+        try:
+            with open(old / "meta.json") as f:
+                meta = json.load(f)
+            older = (old / "meta.json").stat().st_mtime_ns < built
+        except (OSError, ValueError):
+            continue
+        if meta.get("templates_dir") == source and older:
+            shutil.rmtree(old, ignore_errors=True)
+    return path
+
+
+class FeatureCatalog:
+    """
+    Every feature of the training templates with an integer id and a type,
+    memory-mapped from the compiled catalog so all stages and API workers
+    share one copy in the page cache.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / "meta.json") as f:
+            meta = json.load(f)
+        self.signature = meta["templates_signature"]
+        self.templates = meta["templates"]
+        self.names = np.load(self.path / "names.npy", mmap_mode='r')
+        self.types = np.load(self.path / "types.npy", mmap_mode='r')
+
+    @classmethod
+    def load(cls, templates_dir, catalog_dir=None):
+        """The catalog of templates_dir as it is now, compiling it if needed"""
+        return cls(build(templates_dir, catalog_dir))
+
+    def __len__(self):
+        return len(self.names)
+
+    def ids(self, features):
+        """Catalog id of each feature name, -1 for names not in any template"""
+        encoded = [feat.encode() for feat in features]
+        if len(self.names) == 0:
+            return np.full(len(encoded), -1, dtype=np.int64)
+        width = self.names.dtype.itemsize
+        query = np.array(encoded, dtype=self.names.dtype)
+        pos = np.searchsorted(self.names, query)
+        pos[pos == len(self.names)] = 0
+        known = (self.names[pos] == query) & np.array([len(e) <= width for e in encoded], dtype=bool)
+        return np.where(known, pos, -1)
+
+    def decode(self, ids):
+        return [name.decode() for name in self.names[np.asarray(ids)].tolist()]
+
+    def of_type(self, kind):
+        """Names of every feature of one type (GENE, KMER or SNP)"""
+        return self.decode(np.flatnonzero(self.types == kind))
+
+    def template_ids(self, filename):
+        """Column -> catalog id array of one template file"""
+        return np.load(self.path / f"{Path(filename).stem}.npy", mmap_mode='r')
+
+    def status(self):
+        return {
+            "path": str(self.path),
+            "features": len(self),
+            "by_type": {label: int(np.count_nonzero(self.types == kind)) for kind, label in enumerate(TYPE_LABELS)}
+        }
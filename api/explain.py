@@ -0,0 +1,31 @@
+"""SHAP explainers, built once per loaded model and shared by evidence and plots."""
+import numpy as np
+from scipy import sparse
+
+# Column of the resistant class in predict_proba / per-class SHAP outputs
+POSITIVE_CLASS = 1
+
+
+def _dense(X):
+    return X.toarray() if sparse.issparse(X) else np.asarray(X)
+
+
+class TreeShapExplainer:
+    """shap.TreeExplainer over a fitted tree ensemble"""
+
+    def __init__(self, model):
+        import shap
+        self._explainer = shap.TreeExplainer(model)
+
+    def explain(self, X):
+        """(values, base_value) of the resistant class; values has one row per row of X"""
+        values = self._explainer.shap_values(_dense(X))
+        base = np.ravel(self._explainer.expected_value)
+        if isinstance(values, list):
+            # Older shap: one (n, features) array per class
+            return values[POSITIVE_CLASS], float(base[POSITIVE_CLASS])
+        if values.ndim == 3:
+            # Forests: (n, features, classes)
+            return values[:, :, POSITIVE_CLASS], float(base[POSITIVE_CLASS])
+        # Boosted binary models: one log-odds output
+        return values, float(base[0])
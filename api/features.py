@@ -0,0 +1,175 @@
+"""In-process feature alignment: per-genome hits mapped to sparse template-ordered rows."""
+import csv
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from api.catalog import TYPE_LABELS, FeatureCatalog
+
+TEMPLATE_FILES = {
+    "full": "features_full_dataset.txt",
+    "snps_kmers": "features_snps_kmers.txt",
+    "genes_snps": "features_genes_snps.txt"
+}
+
+# Per-genome outputs of the extraction stages: one "feature,value" row per hit
+HIT_FILES = {
+    "genes": "gene_presence_production.csv",
+    "kmers": "kmer_production.csv",
+    "snps": "snp_production.csv"
+}
+
+# Tree models compare float32 features; build values in that dtype so
+# predict_proba does not have to copy them
+DTYPE = np.float32
+
+# The pipeline scores one assembly per job directory under this id
+GENOME_ID = "query_genome"
+
+
+class SparseFeatures:
+    """
+    One genome in a template's column space: sorted positions of its
+    non-zero features and their values. Size scales with the number of
+    hits, not the template width.
+    """
+
+    def __init__(self, indices, values, n_features):
+        self.indices = indices
+        self.values = values
+        self.n_features = n_features
+
+    def __len__(self):
+        return len(self.indices)
+
+    def to_csr(self):
+        """(1, n_features) CSR matrix, accepted by predict_proba as is"""
+        return sparse.csr_matrix(
+            (self.values, self.indices, np.array([0, len(self.indices)])),
+            shape=(1, self.n_features)
+        )
+
+    def toarray(self):
+        X = np.zeros((1, self.n_features), dtype=DTYPE)
+        X[0, self.indices] = self.values
+        return X
+
+
+def stack(rows):
+    """Stack SparseFeatures of the same template into one CSR matrix"""
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(row) for row in rows])
+    indices = np.concatenate([row.indices for row in rows]) if rows else np.zeros(0, dtype=np.int64)
+    values = np.concatenate([row.values for row in rows]) if rows else np.zeros(0, dtype=DTYPE)
+    n_features = rows[0].n_features if rows else 0
+    return sparse.csr_matrix((values, indices, indptr), shape=(len(rows), n_features))
+
+
+class FeatureTemplate:
+    """Feature names of one training matrix, their types and column positions"""
+
+    def __init__(self, name, catalog, filename):
+        self.name = name
+        self.catalog = catalog
+        self.filename = filename
+        # Column -> catalog id, and the reverse (-1 where not in this template)
+        self.ids = np.asarray(catalog.template_ids(filename))
+        self.columns = np.full(len(catalog), -1, dtype=np.int64)
+        self.columns[self.ids] = np.arange(len(self.ids))
+        self.features = catalog.decode(self.ids)
+        self.types = np.asarray(catalog.types[self.ids])
+
+    def __len__(self):
+        return len(self.features)
+
+    def type_label(self, column):
+        return TYPE_LABELS[self.types[column]]
+
+    def align(self, hits):
+        """Map {feature: value} onto this template's columns as SparseFeatures"""
+        ids = self.catalog.ids(hits)
+        columns = np.where(ids >= 0, self.columns[ids], -1)
+        present = columns >= 0
+        order = np.argsort(columns[present], kind='stable')
+        values = np.fromiter(hits.values(), dtype=DTYPE, count=len(hits))
+        return SparseFeatures(columns[present][order], values[present][order], len(self.features))
+
+
+class FeatureTemplates:
+    """
+    The training templates, resolved through the compiled feature catalog.
+
+    get() re-stats the template file and reloads the catalog (compiling it
+    if needed) when the file changed, in step with the model registry's hot
+    reload.
+    """
+
+    def __init__(self, templates_dir, files=TEMPLATE_FILES, catalog_dir=None):
+        self.templates_dir = Path(templates_dir)
+        self.catalog_dir = catalog_dir
+        self.files = files
+        self.paths = {name: self.templates_dir / filename for name, filename in files.items()}
+        self.catalog = None
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def _reload(self):
+        self.catalog = FeatureCatalog.load(self.templates_dir, self.catalog_dir)
+        self._stats = {filename: (size, mtime_ns) for filename, size, mtime_ns in self.catalog.signature}
+        self._templates = {name: FeatureTemplate(name, self.catalog, filename)
+                           for name, filename in self.files.items()}
+
+    def load_all(self):
+        with self._lock:
+            self._reload()
+        return self
+
+    def get(self, name):
+        template = self._templates.get(name)
+        try:
+            st = os.stat(self.paths[name])
+        except OSError:
+            if template is not None:
+                return template
+            raise
+        if template is None or self._stats.get(template.filename) != (st.st_size, st.st_mtime_ns):
+            with self._lock:
+                self._reload()
+                template = self._templates[name]
+        return template
+
+    def status(self):
+        return {name: len(template) for name, template in self._templates.items()}
+
+
+class GenomeFeatures:
+    """Everything the extraction stages found in one genome"""
+
+    def __init__(self, genome_id, hits, counts):
+        self.genome_id = genome_id
+        # feature name -> value, for present features only
+        self.hits = hits
+        # Features detected per kind (genes / kmers / snps)
+        self.counts = counts
+
+
+def read_hits(path):
+    """Rows of a "feature,value" hit file as (feature, int value) pairs"""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return [(row[0], int(float(row[1]))) for row in reader if row]
+
+
+def read_genome_features(work_path):
+    """Collect the gene, k-mer and SNP hits a job's stages wrote to work_path"""
+    hits = {}
+    counts = {}
+    for kind, filename in HIT_FILES.items():
+        rows = read_hits(Path(work_path) / filename)
+        counts[kind] = len(rows)
+        hits.update((feat, value) for feat, value in rows if value != 0)
+    return GenomeFeatures(GENOME_ID, hits, counts)
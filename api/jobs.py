@@ -0,0 +1,315 @@
+"""Job bookkeeping: admission control, background scheduling and result retention."""
+import asyncio
+import fcntl
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pathlib import Path
+
+
+def _now():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+class QueueFull(Exception):
+    """Every pipeline slot is busy and the wait queue is at capacity"""
+
+    def __init__(self, running, queued):
+        super().__init__(f"{running} jobs running, {queued} queued")
+        self.running = running
+        self.queued = queued
+
+
+class JobSlots:
+    """
+    Caps how many pipelines run at once and how many may wait for a slot.
+
+    admit() reserves a place in the queue up front, so a burst of
+    submissions is rejected with QueueFull as soon as max_running slots are
+    busy and max_queued jobs are already waiting.
+    """
+
+    def __init__(self, max_running, max_queued):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.running = 0
+        self.queued = 0
+        self._semaphore = None
+
+    @property
+    def free(self):
+        return max(self.max_running - self.running, 0)
+
+    @property
+    def saturated(self):
+        """True when a bounded submission would be rejected"""
+        return self.running + self.queued >= self.max_running + self.max_queued
+
+    def admit(self, bounded=True):
+        """Reserve a queue place for a new job or raise QueueFull.
+
+        Unbounded admission always succeeds; batch genomes use it so a large
+        batch waits for slots instead of being rejected (it still counts
+        towards the queue, so single submissions see the backlog).
+        """
+        if bounded and self.saturated:
+            raise QueueFull(self.running, self.queued)
+        self.queued += 1
+
+    @asynccontextmanager
+    async def run(self):
+        """Wait for a free slot for an admitted job and hold it"""
+        # Created lazily so the semaphore binds to the serving event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_running)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    def status(self):
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "free_slots": self.free,
+            "max_running": self.max_running,
+            "max_queued": self.max_queued
+        }
+
+
+class Job:
+    """State of one submitted genome, from queue to stored result"""
+
+    def __init__(self, job_id, filename, file_size):
+        self.job_id = job_id
+        self.filename = filename
+        self.file_size = file_size
+        self.status = "queued"
+        self.stages = {}
+        self.error = None
+        self.submitted_at = datetime.utcnow()
+        self.started_at = None
+        self.completed_at = None
+        self.finished_monotonic = None
+        self.result_path = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("completed", "failed")
+
+    def _notify(self):
+        # Wake long-pollers, then arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def start(self):
+        self.status = "running"
+        self.started_at = datetime.utcnow()
+        self._notify()
+
+    def set_stage(self, stage, state):
+        entry = self.stages.setdefault(stage, {"status": "pending"})
+        entry["status"] = state
+        if state == "running":
+            entry["started_at"] = _now()
+            entry["_t0"] = time.monotonic()
+        elif "_t0" in entry:
+            entry["seconds"] = round(time.monotonic() - entry.pop("_t0"), 3)
+        self._notify()
+
+    def _finish(self, status):
+        self.status = status
+        self.completed_at = datetime.utcnow()
+        self.finished_monotonic = time.monotonic()
+        self._notify()
+
+    def complete(self, result_path):
+        self.result_path = result_path
+        self._finish("completed")
+
+    def fail(self, status_code, detail):
+        self.error = {"status_code": status_code, "detail": detail}
+        self._finish("failed")
+
+    async def wait_changed(self, timeout):
+        """Block until the job changes state or timeout elapses"""
+        if self.finished:
+            return
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "filename": self.filename,
+            "stages": {
+                name: {k: v for k, v in entry.items() if not k.startswith("_")}
+                for name, entry in self.stages.items()
+            },
+            "error": self.error,
+            "timestamps": {
+                "submitted_at": self.submitted_at.isoformat() + "Z",
+                "started_at": self.started_at.isoformat() + "Z" if self.started_at else None,
+                "completed_at": self.completed_at.isoformat() + "Z" if self.completed_at else None
+            }
+        }
+
+
+class JobStore:
+    """
+    In-memory job index with results kept as JSON files under results_dir.
+
+    Finished jobs are evicted, together with their result file, ttl_seconds
+    after they complete. The index only exists in the process that took the
+    submission, so one API process serves each results_dir (see claim()).
+    """
+
+    def __init__(self, results_dir, ttl_seconds):
+        self.results_dir = Path(results_dir)
+        self.ttl_seconds = ttl_seconds
+        self._jobs = {}
+        self._lock_file = None
+
+    def claim(self):
+        """Lock results_dir for this process; raises RuntimeError if another API process holds it"""
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.results_dir / ".api.lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise RuntimeError(
+                f"{self.results_dir} is in use by another API process; job state is kept "
+                "in memory, so run one process per RESULTS_DIR (no uvicorn --workers)")
+        self._lock_file = lock_file
+
+    def add(self, job):
+        self._jobs[job.job_id] = job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def _write_json(self, path, data):
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def _explanations_path(self, job):
+        return self.results_dir / f"{job.job_id}.shap.json"
+
+    def save_result(self, job, result, explanations=None):
+        """Persist a finished job's result and SHAP explanations (blocking; run in a worker thread)"""
+        path = self.results_dir / f"{job.job_id}.json"
+        if explanations is not None:
+            self._write_json(self._explanations_path(job), explanations)
+        self._write_json(path, result)
+        return path
+
+    def load_result(self, job):
+        """Read a completed job's result back (blocking; run in a worker thread)"""
+        with open(job.result_path) as f:
+            return json.load(f)
+
+    def load_explanations(self, job):
+        """Per-antibiotic SHAP explanations of a completed job (blocking)"""
+        with open(self._explanations_path(job)) as f:
+            return json.load(f)
+
+    def evict_expired(self):
+        """Drop finished jobs older than the TTL; returns how many were removed"""
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [
+            job for job in self._jobs.values()
+            if job.finished and job.finished_monotonic < cutoff
+        ]
+        for job in expired:
+            del self._jobs[job.job_id]
+            if job.result_path is not None:
+                for path in (job.result_path, self._explanations_path(job)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+        return len(expired)
+
+
+class JobScheduler:
+    """
+    Runs submitted jobs as background tasks, at most slots.max_running at once.
+
+    The job body is a coroutine function taking the Job; it is responsible
+    for calling job.complete() or job.fail(). Its return value becomes the
+    task result, which lets synchronous callers await the job directly.
+    """
+
+    def __init__(self, slots, store):
+        self.slots = slots
+        self.store = store
+        self._waiting = []
+        self._tasks = {}
+
+    @property
+    def in_flight(self):
+        return len(self._tasks)
+
+    def queue_position(self, job_id):
+        """1-based position among jobs waiting for a slot, or None"""
+        try:
+            return self._waiting.index(job_id) + 1
+        except ValueError:
+            return None
+
+    def submit(self, job, runner, bounded=True):
+        """Admit job and start it in the background; raises QueueFull"""
+        self.slots.admit(bounded)
+        self.store.add(job)
+        self._waiting.append(job.job_id)
+        task = asyncio.ensure_future(self._run(job, runner))
+        self._tasks[job.job_id] = task
+        return task
+
+    async def _run(self, job, runner):
+        try:
+            async with self.slots.run():
+                self._waiting.remove(job.job_id)
+                job.start()
+                return await runner(job)
+        except asyncio.CancelledError:
+            if not job.finished:
+                job.fail(503, "Job cancelled during shutdown")
+            raise
+        except Exception as e:
+            if not job.finished:
+                job.fail(500, f"Unexpected error: {str(e)}")
+        finally:
+            if job.job_id in self._waiting:
+                self._waiting.remove(job.job_id)
+            self._tasks.pop(job.job_id, None)
+
+    async def shutdown(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def status(self):
+        status = self.slots.status()
+        status["retained_jobs"] = len(self.store)
+        return status
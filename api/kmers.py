@@ -0,0 +1,62 @@
+"""Training k-mer matcher over packed integer encodings of protein sequences."""
+import numpy as np
+
+BITS_PER_RESIDUE = 5
+
+# A-Z -> 1..26; X (unknown residue), '*' (stop) and anything else never match
+CODES = np.zeros(256, dtype=np.int64)
+CODES[np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWYZ", dtype=np.uint8)] = \
+    np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWYZ", dtype=np.uint8) - ord('A') + 1
+
+
+def pack(seq, k):
+    """Integer encoding of every k-mer window of seq (bytes) and whether it is matchable"""
+    codes = CODES[np.frombuffer(seq, dtype=np.uint8)]
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+    packed = np.zeros(n, dtype=np.int64)
+    for j in range(k):
+        packed = (packed << BITS_PER_RESIDUE) | codes[j:j + n]
+    # A window is matchable if none of its residues encoded to 0
+    invalid = np.concatenate(([0], np.cumsum(codes == 0)))
+    return packed, invalid[k:] - invalid[:n] == 0
+
+
+class KmerMatcher:
+    """
+    Counts occurrences of a fixed set of k-mers in protein sequences.
+
+    The k-mers are packed once into a sorted int64 array (5 bits per residue,
+    so k <= 12); a scan packs every window of the sequences with numpy and
+    looks them up by binary search. Memory and time scale with the total
+    sequence length, whatever the number of distinct k-mers in the hits.
+    """
+
+    def __init__(self, kmers, k):
+        if k * BITS_PER_RESIDUE > 63:
+            raise ValueError(f"k={k} does not fit a packed int64")
+        self.k = k
+        kmers = sorted({kmer for kmer in kmers if len(kmer) == k})
+        # Packed in one pass: the window starting at every (k+1)th byte is a k-mer
+        packed, valid = pack(b"*".join(kmer.encode('ascii', 'replace') for kmer in kmers), k)
+        packed, valid = packed[::k + 1], valid[::k + 1]
+        order = np.argsort(packed[valid], kind='stable')
+        self.codes = packed[valid][order]
+        self.kmers = [kmers[i] for i in np.flatnonzero(valid)[order].tolist()]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def count(self, sequences):
+        """{kmer: occurrences} over all sequences, in order of first occurrence"""
+        # '*' between sequences keeps windows from spanning two hits
+        packed, valid = pack(b"*".join(s.encode('ascii', 'replace') for s in sequences), self.k)
+        if len(self.codes) == 0 or len(packed) == 0:
+            return {}
+        idx = np.searchsorted(self.codes, packed)
+        idx[idx == len(self.codes)] = 0
+        hit = valid & (self.codes[idx] == packed)
+        matched, first, counts = np.unique(idx[hit], return_index=True, return_counts=True)
+        order = np.argsort(first, kind='stable')
+        return {self.kmers[i]: int(c) for i, c in zip(matched[order].tolist(), counts[order].tolist())}
@@ -0,0 +1,46 @@
+"""Prometheus metrics of the API process, kept with prometheus_client."""
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily
+
+# Seconds; spans in-process steps (ms) up to the 600s stage timeouts
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+
+
+class CallbackCounter:
+    """
+    Counter kept by another object (e.g. cache hit counts), read at scrape time:
+    the callback returns {label values tuple: number}.
+    """
+
+    def __init__(self, name, help, labels, callback):
+        self.name = name
+        self.help = help
+        self.labels = list(labels)
+        self.callback = callback
+
+    def collect(self):
+        family = CounterMetricFamily(self.name, self.help, labels=self.labels)
+        for key, value in sorted(self.callback().items()):
+            family.add_metric(list(key), value)
+        yield family
+
+
+class MetricsRegistry(CollectorRegistry):
+    """The metrics of the API process, in registration order"""
+
+    def counter(self, name, help, labels=()):
+        return Counter(name, help, labels, registry=self)
+
+    def gauge(self, name, help, callback=None):
+        gauge = Gauge(name, help, registry=self)
+        if callback is not None:
+            gauge.set_function(callback)
+        return gauge
+
+    def callback_counter(self, name, help, labels, callback):
+        collector = CallbackCounter(name, help, labels, callback)
+        self.register(collector)
+        return collector
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return Histogram(name, help, labels, registry=self, buckets=buckets)
@@ -0,0 +1,359 @@
+"""Feature-extraction pipeline: a DAG of child processes awaited off the event loop."""
+import asyncio
+import functools
+import os
+import signal
+import subprocess
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from api.cache import InputVersions, cache_key
+from api.stages import StageExpired, StageFailure
+
+SCRIPTS_DIR = Path(os.getenv('SCRIPTS_DIR', '/app/scripts'))
+CARD_PROTEIN_FILE = Path(os.getenv('CARD_PROTEIN_FILE', '/app/card_db/card_all_proteins.fasta'))
+REFERENCE_GENOME = Path(os.getenv('REFERENCE_GENOME', '/app/reference/salmonella_LT2.gbff'))
+# Snippy reference prepared once (00c_prepare_reference.sh); its stamp tells jobs it is current
+SNIPPY_REFERENCE_DIR = Path(os.getenv('SNIPPY_REFERENCE_DIR', '/app/reference/snippy'))
+SNIPPY_REFERENCE_STAMP = SNIPPY_REFERENCE_DIR / ".prepared"
+# Code behind the Python stages besides their scripts (see api.stages)
+STAGE_MODULES = [Path(__file__).parent / module
+                 for module in ("stages.py", "card_index.py", "catalog.py", "kmers.py", "snps.py")]
+# Threads shared by the multi-threaded stages (tblastn, Snippy) of one job
+PIPELINE_CPUS = int(os.getenv('PIPELINE_CPUS', '4'))
+# How long a pooled stage may overrun its timeout before its worker is killed
+STAGE_KILL_GRACE_SECONDS = 10
+
+# Executables the stage scripts call; a worker without them cannot run jobs. The
+# second line is what 04_extract_snps.sh runs itself against a prepared reference
+REQUIRED_TOOLS = ["abricate", "makeblastdb", "tblastn", "snippy",
+                  "bwa", "samtools", "samclip", "freebayes-parallel", "bcftools", "vt", "snpEff", "snippy-vcf_to_tab"]
+
+# Commands whose output identifies a tool build and its bundled databases
+TOOL_VERSION_COMMANDS = {
+    "abricate": [["abricate", "--version"], ["abricate", "--list"]],
+    "tblastn": [["tblastn", "-version"]],
+    "snippy": [["snippy", "--version"]],
+}
+
+
+class Stage:
+    """One script invocation and the stages whose outputs it reads"""
+
+    def __init__(self, name, interpreter, script, timeout, deps=(), args=(), threads_env=None,
+                 outputs=(), inputs=(), tools=(), function=None):
+        self.name = name
+        self.interpreter = interpreter
+        self.script = script
+        self.timeout = timeout
+        self.deps = tuple(deps)
+        self.args = tuple(args)
+        # Env var through which the script takes its thread count, if any
+        self.threads_env = threads_env
+        # Files (relative to the job dir) worth caching across jobs; empty = never cached
+        self.outputs = tuple(outputs)
+        # Reference data and external tools that, with the script, determine the outputs
+        code = [SCRIPTS_DIR / script] + (STAGE_MODULES if interpreter == "python3" else [])
+        self.versions = InputVersions(code + list(inputs), salt=" ".join(args))
+        self.tools = tuple(tools)
+        # api.stages function the script wraps; run in a warm worker when a StagePool is given
+        self.function = function
+
+
+# Two independent branches; their outputs are aligned to the templates in-process (api.features):
+#   abricate_card + abricate_resfinder -> abricate_summary -> process_genes -+
+#   blast_db --------------------------------------------------------------+-> tblastn -> kmers
+#   snippy -> process_snps
+STAGES = [
+    Stage("abricate_card", "bash", "01_extract_genes.sh", 300, args=["card"],
+          outputs=["card_production.tsv"], tools=["abricate"]),
+    Stage("abricate_resfinder", "bash", "01_extract_genes.sh", 300, args=["resfinder"],
+          outputs=["resfinder_production.tsv"], tools=["abricate"]),
+    Stage("abricate_summary", "bash", "01_extract_genes.sh", 60,
+          deps=["abricate_card", "abricate_resfinder"], args=["summary"]),
+    Stage("process_genes", "python3", "01b_process_genes.py", 60, deps=["abricate_summary"],
+          function="process_genes"),
+    Stage("blast_db", "bash", "02_create_blast_db.sh", 60),
+    Stage("tblastn", "python3", "03_extract_kmers.py", 600, deps=["process_genes", "blast_db"],
+          args=["blast"], threads_env="BLAST_THREADS",
+          outputs=["blast_production.tsv"], inputs=[CARD_PROTEIN_FILE], tools=["tblastn"]),
+    Stage("kmers", "python3", "03_extract_kmers.py", 60, deps=["tblastn"], args=["kmers"],
+          function="count_kmers"),
+    Stage("snippy", "bash", "04_extract_snps.sh", 600, threads_env="SNIPPY_CPUS",
+          outputs=["snippy_production_out/snps.tab"], inputs=[REFERENCE_GENOME, SNIPPY_REFERENCE_STAMP], tools=["snippy"]),
+    Stage("process_snps", "python3", "04b_process_snps.py", 60, deps=["snippy"],
+          function="process_snps"),
+]
+
+# Stages whose outputs feed scoring (see api.features.HIT_FILES)
+FEATURE_STAGES = ["process_genes", "kmers", "process_snps"]
+
+
+class StageError(Exception):
+    """A pipeline script exited non-zero"""
+
+    def __init__(self, stage, stderr):
+        super().__init__(f"{stage} failed: {stderr[:200]}")
+        self.stage = stage
+        self.stderr = stderr
+
+
+class StageTimeout(Exception):
+    """A pipeline script ran past its timeout and was killed"""
+
+    def __init__(self, stage, timeout):
+        super().__init__(f"{stage} timed out after {timeout}s")
+        self.stage = stage
+        self.timeout = timeout
+
+
+def _ignore(stage, state):
+    pass
+
+
+def _ignore_start():
+    pass
+
+
+def _kill_group(proc):
+    # Stage scripts fork abricate/snippy/tblastn; kill the whole group, not just bash
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def run_stage(interpreter, script, timeout, work_path, args=(), env=None):
+    """Run one stage script inside work_path without blocking the event loop"""
+    proc = await asyncio.create_subprocess_exec(
+        interpreter, str(SCRIPTS_DIR / script), *args,
+        cwd=str(work_path),
+        env=env,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        _kill_group(proc)
+        await proc.wait()
+        raise StageTimeout(script, timeout)
+    except asyncio.CancelledError:
+        _kill_group(proc)
+        await proc.wait()
+        raise
+
+    if proc.returncode != 0:
+        if stderr:
+            output = stderr.decode(errors='replace')
+        else:
+            # Shell stages log tool errors to file and echo the ✗ line on stdout
+            lines = stdout.decode(errors='replace').strip().splitlines()
+            output = "\n".join(l for l in lines[-3:] if not l.startswith("====="))
+        raise StageError(script, output or "Unknown error")
+
+
+async def run_pooled_stage(stage_pool, function, script, timeout, work_path, on_start=_ignore_start):
+    """Run an api.stages function in a warm worker; fails like run_stage does
+
+    on_start() is called once a worker is free, so waiting for one counts
+    neither towards the timeout nor towards the stage's time.
+    """
+    await stage_pool.acquire()
+    future = None
+    try:
+        on_start()
+        # The first attempt may be lost to a pool recycled for another job's stage
+        for attempt in range(2):
+            future = stage_pool.submit(function, work_path, timeout)
+            try:
+                await asyncio.wait_for(asyncio.wrap_future(future), timeout + STAGE_KILL_GRACE_SECONDS)
+                return
+            except StageExpired:
+                raise StageTimeout(script, timeout)
+            except asyncio.TimeoutError:
+                # Not interruptible in its worker; kill the worker rather than leave it running
+                stage_pool.recycle(future)
+                raise StageTimeout(script, timeout)
+            except BrokenProcessPool as e:
+                if attempt:
+                    raise StageError(script, f"{type(e).__name__}: {e}")
+            except StageFailure as e:
+                raise StageError(script, f"✗ ERROR: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                raise StageError(script, f"{type(e).__name__}: {e}")
+    finally:
+        stage_pool.release_after(future)
+
+
+@functools.lru_cache(maxsize=None)
+def tool_version(tool):
+    """Version/database listing of an external tool, probed once per process"""
+    parts = []
+    for cmd in TOOL_VERSION_COMMANDS.get(tool, []):
+        try:
+            proc = subprocess.run(cmd, capture_output=True, timeout=60)
+            parts.append((proc.stdout + proc.stderr).decode(errors='replace').strip())
+        except (OSError, subprocess.TimeoutExpired):
+            parts.append("unavailable")
+    return "\n".join(parts)
+
+
+def snippy_reference_state():
+    """'current', 'stale' or 'missing': whether jobs will use the prepared Snippy reference.
+
+    Mirrors the stamp check in 04_extract_snps.sh; probes snippy once per process.
+    """
+    try:
+        stamp = SNIPPY_REFERENCE_STAMP.read_text().rstrip("\n")
+    except FileNotFoundError:
+        return "missing"
+    try:
+        st = os.stat(REFERENCE_GENOME)
+    except FileNotFoundError:
+        return "stale"
+    expected = f"{st.st_size} {int(st.st_mtime)} {REFERENCE_GENOME}\n{tool_version('snippy')}"
+    return "current" if stamp == expected else "stale"
+
+
+def stage_cache_keys(stages, genome_sha256):
+    """Cache key per stage: the genome plus the config of the stage and everything upstream.
+
+    Blocking (hashes files, probes tools); run in a worker thread.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    configs = {}
+
+    def config(name):
+        if name not in configs:
+            stage = by_name[name]
+            configs[name] = cache_key(
+                name, stage.versions.fingerprint(),
+                *[tool_version(tool) for tool in stage.tools],
+                *[config(dep) for dep in stage.deps]
+            )
+        return configs[name]
+
+    return {name: cache_key(genome_sha256, config(name)) for name in by_name}
+
+
+def _required_stages(stages, cached, targets=None):
+    """Stages that must run: targets (default: final stages) and their ancestors, stopping at cache hits"""
+    by_name = {stage.name: stage for stage in stages}
+    if targets is None:
+        upstream = {dep for stage in stages for dep in stage.deps}
+        targets = [name for name in by_name if name not in upstream]
+    required = set()
+    walk = list(targets)
+    while walk:
+        name = walk.pop()
+        if name in required:
+            continue
+        required.add(name)
+        if name not in cached:
+            walk.extend(by_name[name].deps)
+    return required - cached
+
+
+def _stage_env(stage, unfinished, cpus):
+    if stage.threads_env is None:
+        return None
+    # Split the budget across threaded stages that can still overlap this one
+    sharing = sum(1 for s in unfinished if s.threads_env is not None)
+    env = dict(os.environ)
+    env[stage.threads_env] = str(max(1, cpus // max(sharing, 1)))
+    return env
+
+
+async def run_pipeline(work_path, on_stage=_ignore, cpus=PIPELINE_CPUS, stages=STAGES,
+                       targets=FEATURE_STAGES, genome_sha256=None, stage_cache=None, stage_pool=None):
+    """Run the stage DAG against one job's work directory.
+
+    Every stage starts as soon as its dependencies have completed, so the
+    ABRicate/BLAST branch and the Snippy branch overlap and wall time tracks
+    the longest branch. Stages resolve their inputs from their own cwd, so
+    the job directory is passed per subprocess; the API process never
+    changes its cwd.
+
+    Only targets and the stages they depend on are run (all final stages
+    if targets is None).
+
+    With a stage_cache, stages declaring outputs are restored from earlier
+    runs on the same genome and stages that only fed them are skipped, so a
+    model or template change reruns just the cheap post-processing.
+
+    With a stage_pool, stages backed by an api.stages function run in its
+    warm workers instead of a fresh interpreter.
+
+    on_stage(name, state) is called as each stage is waiting (for a pool
+    worker)/running/completed/cached/skipped/failed/cancelled. The first
+    failure cancels the rest and raises StageError or StageTimeout.
+    """
+    loop = asyncio.get_event_loop()
+    keys = {}
+    cached = set()
+    if stage_cache is not None and stage_cache.enabled and genome_sha256:
+        keys = await loop.run_in_executor(None, stage_cache_keys, stages, genome_sha256)
+        for stage in stages:
+            if stage.outputs and await loop.run_in_executor(
+                    None, stage_cache.restore, keys[stage.name], work_path, stage.outputs):
+                cached.add(stage.name)
+                on_stage(stage.name, "cached")
+
+    required = _required_stages(stages, cached, targets)
+    for stage in stages:
+        if stage.name not in required and stage.name not in cached:
+            on_stage(stage.name, "skipped")
+
+    pending = {stage.name: stage for stage in stages if stage.name in required}
+    done = set(cached)
+    running = {}
+
+    try:
+        while pending or running:
+            ready = [s for s in pending.values() if all(d in done for d in s.deps)]
+            if not ready and not running:
+                raise RuntimeError(f"Unsatisfiable stage dependencies: {sorted(pending)}")
+            unfinished = list(pending.values()) + list(running.values())
+            for stage in ready:
+                del pending[stage.name]
+                if stage.function and stage_pool is not None and stage_pool.enabled:
+                    # "running" once a worker takes it (see run_pooled_stage)
+                    on_stage(stage.name, "waiting")
+                    task = asyncio.ensure_future(run_pooled_stage(
+                        stage_pool, stage.function, stage.script, stage.timeout, work_path,
+                        functools.partial(on_stage, stage.name, "running")
+                    ))
+                else:
+                    env = _stage_env(stage, unfinished, cpus)
+                    task = asyncio.ensure_future(run_stage(
+                        stage.interpreter, stage.script, stage.timeout, work_path, stage.args, env
+                    ))
+                    on_stage(stage.name, "running")
+                running[task] = stage
+
+            finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            failure = None
+            for task in finished:
+                stage = running.pop(task)
+                if task.exception() is not None:
+                    on_stage(stage.name, "failed")
+                    failure = failure or task.exception()
+                else:
+                    if stage.outputs and stage.name in keys:
+                        await loop.run_in_executor(
+                            None, stage_cache.store, keys[stage.name], work_path, stage.outputs)
+                    done.add(stage.name)
+                    on_stage(stage.name, "completed")
+            if failure is not None:
+                raise failure
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+            for stage in running.values():
+                on_stage(stage.name, "cancelled")
@@ -0,0 +1,122 @@
+"""SHAP force plot rendering in a pool of warm worker processes."""
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+import multiprocessing
+
+PLOT_WORKERS = int(os.getenv('PLOT_WORKERS', '2'))
+
+# Same look as the inline plots always had (shap's default force plot size)
+FIGSIZE = (20, 3)
+DPI = 150
+
+
+def _init_worker():
+    """Import matplotlib and shap once per worker, not once per plot"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot  # noqa: F401
+    import shap  # noqa: F401
+
+
+def _warm():
+    return os.getpid()
+
+
+def render(explanation, antibiotic, fmt="png"):
+    """Draw a stored explanation as a force plot; returns the image bytes (runs in a worker)"""
+    import numpy as np
+    import matplotlib.pyplot as plt
+    import shap
+
+    # With figsize and show=False shap draws into a new Figure and returns it,
+    # so everything below works on that Figure rather than pyplot's current one
+    fig = shap.force_plot(
+        explanation["base_value"],
+        np.array(explanation["shap_values"]),
+        np.array(explanation["values"]),
+        feature_names=explanation["features"],
+        matplotlib=True,
+        show=False,
+        figsize=FIGSIZE,
+        text_rotation=10
+    )
+    try:
+        fig.axes[0].set_title(f"{antibiotic.capitalize()} - Feature Contributions", fontsize=14, fontweight='bold')
+        buf = BytesIO()
+        fig.savefig(buf, format=fmt, dpi=DPI, bbox_inches='tight', facecolor='white')
+        return buf.getvalue()
+    finally:
+        plt.close(fig)
+
+
+class PlotPool:
+    """
+    Worker processes that render force plots.
+
+    Each worker is single-threaded with its own matplotlib state, so plots
+    render in parallel across cores without holding the API's GIL. A pool
+    whose worker died is replaced on the next submit.
+    """
+
+    def __init__(self, workers=PLOT_WORKERS):
+        self.workers = workers
+        self.rendered = 0
+        self.render_seconds = 0.0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # Never fork the API process with its threads and event loop
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker
+                )
+            return self._executor
+
+    def start(self):
+        """Spawn the workers and run their imports ahead of the first plot"""
+        pool = self._pool()
+        for _ in range(self.workers):
+            pool.submit(_warm)
+        return self
+
+    def submit(self, explanation, antibiotic, fmt="png"):
+        """concurrent.futures.Future of the rendered image bytes"""
+        pool = self._pool()
+        try:
+            future = pool.submit(render, explanation, antibiotic, fmt)
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is pool:
+                    self._executor = None
+            pool.shutdown(wait=False)
+            future = self._pool().submit(render, explanation, antibiotic, fmt)
+        started = time.perf_counter()
+        future.add_done_callback(lambda f: self._record(time.perf_counter() - started))
+        return future
+
+    def _record(self, seconds):
+        with self._lock:
+            self.rendered += 1
+            self.render_seconds += seconds
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def status(self):
+        return {
+            "workers": self.workers,
+            "started": self._executor is not None,
+            "rendered": self.rendered,
+            "avg_render_seconds": round(self.render_seconds / self.rendered, 4) if self.rendered else None
+        }
@@ -0,0 +1,160 @@
+"""Model registry: unpickle every model once, keep it warm, hot-reload on change."""
+import hashlib
+import os
+import pickle
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+MODEL_FILES = {
+    "pefoxacin_full": "pefoxacin_full_model.pkl",
+    "trimethoprim_full": "trimethoprim_full_model.pkl",
+    "sulfamethoxazole_full": "sulfamethoxazole_full_model.pkl",
+    "pefoxacin_partial": "pefoxacin_snps_kmers_model.pkl",
+    "trimethoprim_partial": "trimethoprim_snps_kmers_model.pkl",
+    "sulfamethoxazole_partial": "sulfamethoxazole_genes_snps_model.pkl"
+}
+
+
+def model_paths(models_dir):
+    """Map registry names to pickle paths under models_dir"""
+    return {name: Path(models_dir) / filename for name, filename in MODEL_FILES.items()}
+
+
+class LoadedModel:
+    """A model instance together with the metadata it was loaded with"""
+
+    def __init__(self, name, path, model, mtime_ns, load_seconds, memory_bytes, sha256=None):
+        self.name = name
+        self.path = path
+        self.model = model
+        self.mtime_ns = mtime_ns
+        # Content hash of the pickle this instance came from
+        self.sha256 = sha256
+        self.load_seconds = load_seconds
+        self.memory_bytes = memory_bytes
+        self.loaded_at = datetime.utcnow()
+        # Column order the model was fitted with; aligned inputs must follow it
+        names = getattr(model, "feature_names_in_", None)
+        self.feature_names = [str(n) for n in names] if names is not None else None
+        self._explainer = None
+        self._explainer_lock = threading.Lock()
+        self.explainer_seconds = None
+
+    def explainer(self):
+        """SHAP explainer for this model instance, built on first use"""
+        if self._explainer is None:
+            with self._explainer_lock:
+                if self._explainer is None:
+                    from api.explain import TreeShapExplainer
+                    start = time.perf_counter()
+                    self._explainer = TreeShapExplainer(self.model)
+                    self.explainer_seconds = time.perf_counter() - start
+        return self._explainer
+
+    @property
+    def version(self):
+        """Short content hash identifying the deployed model"""
+        return self.sha256[:12] if self.sha256 else None
+
+    def info(self):
+        return {
+            "path": str(self.path),
+            "n_features": len(self.feature_names) if self.feature_names else None,
+            "load_seconds": round(self.load_seconds, 4),
+            "memory_mb": round(self.memory_bytes / (1024 * 1024), 2),
+            "loaded_at": self.loaded_at.isoformat() + "Z",
+            "mtime": datetime.utcfromtimestamp(self.mtime_ns / 1e9).isoformat() + "Z",
+            "version": self.version,
+            # None until the SHAP explainer has been built
+            "explainer_seconds": round(self.explainer_seconds, 4) if self.explainer_seconds is not None else None
+        }
+
+
+class ModelRegistry:
+    """
+    Holds one unpickled instance per model file.
+
+    Models are loaded once by load_all(). get() re-stats the pickle and
+    transparently reloads it when its mtime changes, so a model can be
+    swapped on disk without restarting the worker.
+    """
+
+    def __init__(self, paths):
+        self.paths = dict(paths)
+        self._models = {}
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _load(self, name):
+        path = self.paths[name]
+        mtime_ns = os.stat(path).st_mtime_ns
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            data = f.read()
+        sha256 = hashlib.sha256(data).hexdigest()
+        model = pickle.loads(data)
+        elapsed = time.perf_counter() - start
+        # The pickle size stands in for the model's footprint: the ensembles are
+        # mostly numpy tree arrays, stored at their in-memory size
+        return LoadedModel(name, path, model, mtime_ns, elapsed, len(data), sha256)
+
+    def load_all(self, explainers=False):
+        """Load every registered model, replacing anything already held"""
+        with self._lock:
+            for name in self.paths:
+                self._models[name] = self._load(name)
+        if explainers:
+            self.load_explainers()
+        return self
+
+    def load_explainers(self):
+        """Build the explainer of every loaded model ahead of its first request"""
+        for entry in list(self._models.values()):
+            entry.explainer()
+        return self
+
+    def get(self, name):
+        """Return the LoadedModel for name, reloading it if the pickle changed"""
+        entry = self._models.get(name)
+        try:
+            mtime_ns = os.stat(self.paths[name]).st_mtime_ns
+        except OSError:
+            # File vanished mid-deploy: keep serving the copy we have
+            if entry is not None:
+                return entry
+            raise
+        if entry is not None and entry.mtime_ns == mtime_ns:
+            return entry
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is None or entry.mtime_ns != mtime_ns:
+                if entry is not None:
+                    self.reloads += 1
+                entry = self._load(name)
+                self._models[name] = entry
+        return entry
+
+    def model(self, name):
+        return self.get(name).model
+
+    @property
+    def loaded(self):
+        return len(self._models) == len(self.paths)
+
+    def versions(self):
+        """Version of every loaded model, by registry name"""
+        return {name: entry.version for name, entry in self._models.items()}
+
+    def status(self):
+        """Load statistics for /health"""
+        models = {name: entry.info() for name, entry in self._models.items()}
+        return {
+            "loaded": self.loaded,
+            "count": len(self._models),
+            "reloads": self.reloads,
+            "total_load_seconds": round(sum(e.load_seconds for e in self._models.values()), 4),
+            "total_memory_mb": round(sum(e.memory_bytes for e in self._models.values()) / (1024 * 1024), 2),
+            "models": models
+        }
@@ -0,0 +1,77 @@
+"""Training SNP lookup table and streaming readers for Snippy variant files."""
+import csv
+
+import numpy as np
+
+from api.catalog import SNP
+
+# Values pandas used to read as missing in the old DataFrame-based parser
+MISSING = {'', '.', 'nan', 'NaN'}
+
+
+def normalize_chrom(chrom):
+    """NC_003197.2 -> NC_003197, the form SNP feature names use"""
+    return chrom.strip().split('.')[0]
+
+
+def read_snippy_tab(path):
+    """(chrom, pos, ref, alt) per row of a Snippy snps.tab, streamed"""
+    with open(path, newline='') as f:
+        reader = csv.reader(f, delimiter='\t')
+        header = next(reader, None)
+        if header is None:
+            return
+        cols = [header.index(name) for name in ('CHROM', 'POS', 'REF', 'ALT')]
+        for row in reader:
+            # Short rows read as missing values, which never match
+            chrom, pos, ref, alt = (row[i] if i < len(row) else '' for i in cols)
+            yield normalize_chrom(chrom), pos.strip(), ref.strip(), alt.strip()
+
+
+def read_snippy_vcf(path):
+    """(chrom, pos, ref, alt) per allele of a Snippy snps.vcf, streamed"""
+    with open(path) as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 5:
+                continue
+            for alt in fields[4].split(','):
+                yield normalize_chrom(fields[0]), fields[1].strip(), fields[3].strip(), alt.strip()
+
+
+def read_variants(path):
+    return read_snippy_vcf(path) if path.endswith('.vcf') else read_snippy_tab(path)
+
+
+class SnpTable:
+    """
+    (chrom, pos) -> {"ref>alt": catalog id} over the SNP features of the
+    feature catalog.
+
+    A variant is matched with two dict lookups instead of formatting its
+    feature name; only matches are turned back into names.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        ids = np.flatnonzero(catalog.types == SNP)
+        self.sites = {}
+        for i, feat in zip(ids.tolist(), catalog.decode(ids)):
+            chrom, pos, change = feat.rsplit('_', 2)
+            if pos.isdigit():
+                self.sites.setdefault((chrom, int(pos)), {})[change] = i
+        self.size = len(ids)
+
+    def __len__(self):
+        return self.size
+
+    def lookup(self, chrom, pos, ref, alt):
+        """Catalog id of one variant, or None if it is not a training SNP"""
+        if not pos.isdigit():
+            return None
+        changes = self.sites.get((chrom, int(pos)))
+        if changes is None or ref in MISSING or alt in MISSING or chrom in MISSING:
+            return None
+        return changes.get(f"{ref}>{alt}")
@@ -0,0 +1,415 @@
+"""
+In-Python pipeline stages as importable functions, and the warm worker
+processes that run them.
+
+Each function takes a job directory, reads its inputs from there, writes
+its outputs and logs/<script>.log next to them, and raises StageFailure
+on bad input. Nothing depends on the process cwd, so one worker serves
+every job. The CLI scripts in scripts/ are thin wrappers around them.
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+STAGE_WORKERS = int(os.getenv('STAGE_WORKERS', '2'))
+
+TEMPLATE_DIR = os.getenv('FEATURE_TEMPLATES_DIR', '/app/feature_templates')
+CARD_PROTEIN_FILE = os.getenv('CARD_PROTEIN_FILE', '/app/card_db/card_all_proteins.fasta')
+CARD_INDEX_DIR = os.getenv('CARD_INDEX_DIR', '/app/card_db/index')
+
+GENOME_FILE = "query_genome.fna"
+BLAST_OUTPUT = "blast_production.tsv"
+CARD_QUERY_FILE = "card_query.faa"
+E_VALUE = 1e-5
+MIN_IDENTITY = 80
+MIN_LENGTH = 50
+
+
+class StageFailure(Exception):
+    """A stage's inputs are missing or unusable (the scripts' "✗ ERROR" exit)"""
+
+
+# A BaseException, so the stages' own "except Exception" blocks let it through
+class StageExpired(BaseException):
+    """A pooled stage ran past its timeout and was interrupted in its worker"""
+
+
+class StageLog:
+    """Appends to logs/<name>.log in the job directory, echoing to stdout when run from the CLI"""
+
+    def __init__(self, work_dir, name, title, echo=False):
+        self.path = os.path.join(work_dir, "logs", f"{name}.log")
+        self.echo = echo
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as f:
+            f.write(title + '\n')
+
+    def __call__(self, msg):
+        if self.echo:
+            print(msg)
+        with open(self.path, 'a') as f:
+            f.write(msg + '\n')
+
+    def fail(self, msg):
+        self(f"✗ ERROR: {msg}")
+        raise StageFailure(msg)
+
+
+# ---------------------------------------------------------------- static inputs, once per process
+
+def _file_version(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+@functools.lru_cache(maxsize=4)
+def _snp_table(catalog_path):
+    from api.catalog import FeatureCatalog
+    from api.snps import SnpTable
+    return SnpTable(FeatureCatalog(catalog_path))
+
+
+@functools.lru_cache(maxsize=4)
+def _kmer_matcher(catalog_path):
+    from api.catalog import KMER, KMER_SIZE, FeatureCatalog
+    from api.kmers import KmerMatcher
+    return KmerMatcher(FeatureCatalog(catalog_path).of_type(KMER), KMER_SIZE)
+
+
+@functools.lru_cache(maxsize=4)
+def _card_index(card_file, index_dir, version):
+    from api.card_index import CardIndex
+    return CardIndex(card_file, index_dir)
+
+
+def snp_table(template_dir=TEMPLATE_DIR):
+    """SnpTable of the current catalog; rebuilt only when a template changes"""
+    from api.catalog import build
+    return _snp_table(build(template_dir))
+
+
+def kmer_matcher(template_dir=TEMPLATE_DIR):
+    from api.catalog import build
+    return _kmer_matcher(build(template_dir))
+
+
+def card_index(card_file=CARD_PROTEIN_FILE, index_dir=CARD_INDEX_DIR):
+    return _card_index(card_file, index_dir, _file_version(card_file))
+
+
+# ---------------------------------------------------------------- stages
+
+def process_genes(work_dir, echo=False):
+    """ABRicate summary -> gene_presence_production.csv (one row per gene)"""
+    import pandas as pd
+
+    log = StageLog(work_dir, "01b_process_genes", "SCRIPT 1b: PROCESS GENES", echo)
+    log("Loading ABRicate outputs...")
+
+    if os.path.exists(os.path.join(work_dir, GENOME_FILE)):
+        genome_id = 'query_genome'
+    else:
+        log.fail(f"{GENOME_FILE} not found")
+
+    try:
+        summary = pd.read_csv(os.path.join(work_dir, 'gene_summary_production.tsv'), sep='\t')
+        log(f"  Summary matrix shape: {summary.shape}")
+    except Exception as e:
+        log.fail(e)
+
+    log("Processing gene matrix...")
+
+    summary.rename(columns={'#FILE': 'Genome_ID'}, inplace=True)
+    summary['Genome_ID'] = genome_id
+
+    def make_binary(val):
+        val_str = str(val).strip()
+        if val_str in ['0', '', '0.0', '.', 'nan']:
+            return 0
+        return 1
+
+    drop_cols = [c for c in summary.columns if 'NUM_FOUND' in c.upper()]
+    if drop_cols:
+        summary.drop(columns=drop_cols, inplace=True)
+
+    cols_to_binarize = [c for c in summary.columns if c != 'Genome_ID']
+    for col in cols_to_binarize:
+        summary[col] = summary[col].apply(make_binary)
+
+    if len(summary) > 1:
+        feature_cols = [c for c in summary.columns if c != 'Genome_ID']
+        collapsed = summary[feature_cols].max(axis=0)
+        final_row = pd.DataFrame([collapsed])
+        final_row.insert(0, 'Genome_ID', genome_id)
+        summary = final_row
+
+    # Sparse hit list: one row per gene rather than one column
+    feature_cols = [c for c in summary.columns if c != 'Genome_ID']
+    hits = pd.DataFrame({'feature': feature_cols, 'value': [int(summary[c].iloc[0]) for c in feature_cols]})
+    hits.to_csv(os.path.join(work_dir, 'gene_presence_production.csv'), index=False)
+
+    log(f"  Genome ID: {summary['Genome_ID'].iloc[0]}")
+    log(f"  Total gene features: {len(hits)}")
+    log("✓ Saved: gene_presence_production.csv")
+
+
+def run_blast(work_dir, threads=4, timeout=None, echo=False, log=None):
+    """tBLASTn of the CARD proteins of the detected genes -> blast_production.tsv"""
+    import pandas as pd
+
+    log = log or StageLog(work_dir, "03_extract_kmers_blast", "SCRIPT 3: K-MER EXTRACTION (blast)", echo)
+    log("Loading resistance gene list...")
+    gene_df = pd.read_csv(os.path.join(work_dir, 'gene_presence_production.csv'), keep_default_na=False)
+    resistance_genes = gene_df['feature'].tolist()
+    log(f"  Resistance genes: {len(resistance_genes)}")
+
+    log("Selecting CARD proteins...")
+    index = card_index()
+    scanned = index.resolve(resistance_genes)
+    query_fasta, matched_genes, n_proteins = index.query_set(
+        resistance_genes, os.path.join(work_dir, CARD_QUERY_FILE))
+    log(f"  Index lookups: {len(resistance_genes) - scanned}, new genes scanned: {scanned}")
+    log(f"  Matched {matched_genes}/{len(resistance_genes)} genes")
+    log(f"  Filtered proteins: {n_proteins}")
+
+    log("Running tBLASTn...")
+    t_start = time.time()
+
+    subprocess.run([
+        "tblastn", "-query", query_fasta, "-db", os.path.join(work_dir, "blast_db/query_genome"),
+        "-out", os.path.join(work_dir, BLAST_OUTPUT), "-outfmt", "6 qseqid sseqid pident length qseq sseq",
+        "-evalue", str(E_VALUE), "-max_target_seqs", "5", "-num_threads", str(threads)
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True, timeout=timeout)
+    # The database is a second copy of the genome and nothing else reads it
+    shutil.rmtree(os.path.join(work_dir, "blast_db"), ignore_errors=True)
+
+    elapsed = int(time.time() - t_start)
+    log(f"  BLAST completed in {elapsed} seconds")
+
+
+def count_kmers(work_dir, echo=False, log=None):
+    """Training k-mers in the BLAST hits -> kmer_production.csv"""
+    import pandas as pd
+
+    log = log or StageLog(work_dir, "03_extract_kmers_kmers", "SCRIPT 3: K-MER EXTRACTION (kmers)", echo)
+    log("Loading training k-mer feature list...")
+    matcher = kmer_matcher()
+    log(f"  Training k-mers to look for: {len(matcher)}")
+
+    blast_output = os.path.join(work_dir, BLAST_OUTPUT)
+    kmer_output = os.path.join(work_dir, 'kmer_production.csv')
+    if not os.path.exists(blast_output) or os.path.getsize(blast_output) == 0:
+        log("⚠ No BLAST hits - all k-mers will be 0")
+        pd.DataFrame(columns=['feature', 'value']).to_csv(kmer_output, index=False)
+        log("✓ Saved: kmer_production.csv")
+        return
+
+    blast_df = pd.read_csv(blast_output, sep='\t', names=['query_id', 'subject_id', 'pident', 'length', 'query_seq', 'subject_seq'])
+    blast_df = blast_df[(blast_df['pident'] >= MIN_IDENTITY) & (blast_df['length'] >= MIN_LENGTH)]
+    log(f"  Passing BLAST hits: {len(blast_df)}")
+
+    log("Extracting k-mers...")
+    matched_kmers = matcher.count(seq.replace('-', '') for seq in blast_df['subject_seq'])
+    log(f"  K-mers matching training: {len(matched_kmers)}")
+
+    pd.DataFrame({'feature': list(matched_kmers), 'value': list(matched_kmers.values())}) \
+        .to_csv(kmer_output, index=False)
+    log("✓ Saved: kmer_production.csv")
+
+
+def process_snps(work_dir, variants=None, echo=False):
+    """Snippy variants -> snp_production.csv (training SNPs only)"""
+    import csv
+    from api.snps import read_variants
+
+    log = StageLog(work_dir, "04b_process_snps", "SCRIPT 4b: PROCESS SNPs", echo)
+    variants = variants or os.path.join(work_dir, "snippy_production_out", "snps.tab")
+    if not os.path.exists(variants):
+        log.fail(f"{variants} not found")
+
+    log("Loading training SNP table...")
+    table = snp_table()
+    log(f"  Training SNPs: {len(table)}")
+
+    log(f"Matching Snippy variants ({os.path.basename(variants)})...")
+    raw_variants = 0
+    matched_snps = 0
+    snp_hits = {}
+    for variant in read_variants(variants):
+        raw_variants += 1
+        index = table.lookup(*variant)
+        if index is not None:
+            snp_hits[index] = 1
+            matched_snps += 1
+
+    log(f"  Raw variants: {raw_variants}")
+    log(f"  SNPs matching training: {matched_snps}")
+    with open(os.path.join(work_dir, 'snp_production.csv'), 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['feature', 'value'])
+        writer.writerows(zip(table.catalog.decode(list(snp_hits)), snp_hits.values()))
+    log("✓ Saved: snp_production.csv")
+
+
+# Functions a StagePool may run, by the name pipeline stages refer to them
+STAGE_FUNCTIONS = {
+    "process_genes": process_genes,
+    "count_kmers": count_kmers,
+    "process_snps": process_snps,
+}
+
+
+# ---------------------------------------------------------------- workers
+
+def _expire(signum, frame):
+    raise StageExpired()
+
+
+def _init_worker():
+    """Import pandas and the lookup tables once per worker, not once per stage"""
+    import pandas  # noqa: F401
+    signal.signal(signal.SIGALRM, _expire)
+
+
+def _warm():
+    snp_table()
+    kmer_matcher()
+    return os.getpid()
+
+
+def _call(name, work_dir, timeout):
+    # Interrupts the stage at its next Python bytecode once timeout has passed
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        STAGE_FUNCTIONS[name](work_dir)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class StagePool:
+    """
+    Long-lived worker processes that run the in-Python stages.
+
+    Stages submitted here skip interpreter start-up, the pandas import and
+    re-reading the feature catalog on every job. A worker is single-threaded
+    and stateless between jobs apart from those caches. A pool whose worker
+    died is replaced on the next submit.
+
+    A stage past its timeout is interrupted inside its worker (StageExpired).
+    One stuck where that cannot reach it (a long C call) is stopped with
+    recycle(), which kills the workers of its pool and starts a fresh one;
+    stages that were running beside it fail with BrokenProcessPool.
+    """
+
+    def __init__(self, workers=STAGE_WORKERS):
+        self.workers = workers
+        self.completed = 0
+        self.stage_seconds = 0.0
+        self.recycled = 0
+        self._executor = None
+        # Pool each unfinished future was submitted to, for recycle()
+        self._owners = {}
+        self._slots = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # Never fork the API process with its threads and event loop
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker
+                )
+            return self._executor
+
+    def start(self):
+        """Spawn the workers and load their imports and tables ahead of the first job"""
+        pool = self._pool()
+        for _ in range(self.workers):
+            pool.submit(_warm)
+        return self
+
+    async def acquire(self):
+        """Wait for an idle worker, so the stage submitted next starts at once rather than queueing"""
+        # Created lazily so the semaphore binds to the serving event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        await self._slots.acquire()
+
+    def release_after(self, future):
+        """Give the worker back once future is done (at once if nothing was submitted)"""
+        if future is None:
+            self._slots.release()
+            return
+        # A cancelled or timed-out stage keeps its worker busy until it stops
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._slots.release))
+
+    def submit(self, name, work_dir, timeout):
+        """concurrent.futures.Future of running STAGE_FUNCTIONS[name] on work_dir, interrupted after timeout seconds"""
+        pool = self._pool()
+        try:
+            future = pool.submit(_call, name, str(work_dir), timeout)
+        except BrokenProcessPool:
+            self._discard(pool)
+            pool = self._pool()
+            future = pool.submit(_call, name, str(work_dir), timeout)
+        started = time.perf_counter()
+        with self._lock:
+            self._owners[future] = pool
+        future.add_done_callback(lambda f: self._record(f, time.perf_counter() - started))
+        return future
+
+    def _record(self, future, seconds):
+        with self._lock:
+            self._owners.pop(future, None)
+            self.completed += 1
+            self.stage_seconds += seconds
+
+    def recycle(self, future):
+        """Kill the workers of the pool running future; later submits get a fresh pool"""
+        with self._lock:
+            pool = self._owners.get(future)
+            if pool is None:
+                return
+            if self._executor is pool:
+                self._executor = None
+            self.recycled += 1
+        # ProcessPoolExecutor has no public way to stop a running task
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _discard(self, pool):
+        with self._lock:
+            if self._executor is pool:
+                self._executor = None
+        pool.shutdown(wait=False)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def status(self):
+        return {
+            "workers": self.workers,
+            "started": self._executor is not None,
+            "completed": self.completed,
+            "recycled": self.recycled,
+            "avg_stage_seconds": round(self.stage_seconds / self.completed, 4) if self.completed else None
+        }
@@ -0,0 +1,94 @@
+"""Streaming intake of uploaded genomes: copied to disk in chunks, hashed and checked as FASTA on the way."""
+import hashlib
+
+GENOME_FILE = "query_genome.fna"
+CHUNK_SIZE = 1024 * 1024
+MAX_GENOME_BYTES = 10 * 1024 * 1024
+MIN_GENOME_BYTES = 1000
+
+# IUPAC nucleotide codes, gaps and stops; anything else in a sequence line is not an assembly
+SEQUENCE_BYTES = b"ACGTUNRYKMSWBDHVacgtunrykmswbdhv-.*"
+WHITESPACE = b" \t\r"
+
+
+class InvalidGenome(ValueError):
+    """An upload that cannot be a genome assembly; the message is meant for the client"""
+
+
+def check_size(size):
+    if size > MAX_GENOME_BYTES:
+        raise InvalidGenome("File too large. Maximum size is 10MB")
+    if size < MIN_GENOME_BYTES:
+        raise InvalidGenome("File too small. Please upload a valid genome assembly")
+
+
+class FastaValidator:
+    """
+    Checks FASTA structure chunk by chunk: a '>' header first, then only
+    nucleotide codes in sequence lines, and at least one residue overall.
+    Lines split across chunks are carried over to the next one.
+    """
+
+    def __init__(self):
+        self.records = 0
+        self.residues = 0
+        self._carry = b""
+
+    def feed(self, chunk):
+        lines = (self._carry + chunk).split(b"\n")
+        self._carry = lines.pop()
+        self._lines(lines)
+
+    def _lines(self, lines):
+        if self.records == 0:
+            # Only blank lines may come before the first header
+            for start, line in enumerate(lines):
+                if line.startswith(b">"):
+                    break
+                if line.translate(None, WHITESPACE):
+                    raise InvalidGenome("Invalid FASTA: the file must start with a '>' header line")
+            else:
+                return
+            lines = lines[start:]
+        # Sequence lines are checked together rather than one by one
+        headers = sum(1 for line in lines if line.startswith(b">"))
+        seq = b"".join(line for line in lines if not line.startswith(b">")).translate(None, WHITESPACE)
+        bad = seq.translate(None, SEQUENCE_BYTES)
+        if bad:
+            raise InvalidGenome(f"Invalid FASTA: unexpected character {chr(bad[0])!r} in a sequence line")
+        self.records += headers
+        self.residues += len(seq)
+
+    def close(self):
+        """Check the last line and the totals once the upload has been read"""
+        self._lines([self._carry])
+        self._carry = b""
+        if self.residues == 0:
+            raise InvalidGenome("Invalid FASTA: no sequence found")
+
+
+def spool_genome(source, path, chunk_size=CHUNK_SIZE):
+    """
+    Copy a genome from a binary file object to path; returns (size, sha256).
+
+    source is normally Starlette's spooled copy of the upload, which already
+    holds the whole body (in memory up to 1 MB, on disk beyond), so this
+    bounds what the handler holds to one chunk but does not cap what the
+    client may send. InvalidGenome is raised as soon as the copy exceeds
+    MAX_GENOME_BYTES or stops looking like FASTA; the caller removes the
+    partial file.
+    """
+    h = hashlib.sha256()
+    validator = FastaValidator()
+    size = 0
+    with open(path, "wb") as out:
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            size += len(chunk)
+            if size > MAX_GENOME_BYTES:
+                check_size(size)
+            validator.feed(chunk)
+            h.update(chunk)
+            out.write(chunk)
+    check_size(size)
+    validator.close()
+    return size, h.hexdigest()
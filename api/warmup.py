@@ -0,0 +1,85 @@
+"""Startup warm-up: heavy imports, models, explainers and templates, timed phase by phase."""
+import importlib
+import logging
+import threading
+import time
+import traceback
+from datetime import datetime
+
+# Imported up front so their cost shows up as its own phase rather than
+# inside the first model load (its load_seconds) or the first request
+HEAVY_MODULES = ["sklearn.ensemble", "shap"]
+
+# uvicorn configures this logger; records land next to its startup lines
+logger = logging.getLogger("uvicorn.error")
+
+
+def import_modules(modules=HEAVY_MODULES):
+    """Import modules in order; returns {module: seconds}"""
+    timings = {}
+    for module in modules:
+        start = time.perf_counter()
+        importlib.import_module(module)
+        timings[module] = time.perf_counter() - start
+    return timings
+
+
+class Warmup:
+    """
+    Runs the warm-up phases once and records how long each took.
+
+    ready turns true only after every phase succeeded; until then /health
+    reports the worker as starting.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.state = "pending"
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def phase(self, name, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self.phases[name] = round(seconds, 4)
+        logger.info("Warm-up: %s took %.2fs", name, seconds)
+        return result
+
+    def run(self, phases):
+        """Run [(name, fn)] in order (blocking); a failing phase stops the warm-up"""
+        self.state = "running"
+        self.started_at = datetime.utcnow()
+        start = time.perf_counter()
+        try:
+            for name, fn in phases:
+                self.phase(name, fn)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.state = "failed"
+            logger.error("Warm-up failed: %s\n%s", self.error, traceback.format_exc())
+        else:
+            self.state = "ready"
+            logger.info("Warm-up finished in %.2fs", time.perf_counter() - start)
+        finally:
+            self.finished_at = datetime.utcnow()
+        return self
+
+    def status(self):
+        with self._lock:
+            phases = dict(self.phases)
+        return {
+            "state": self.state,
+            "phases": phases,
+            "total_seconds": round(sum(phases.values()), 4),
+            "started_at": self.started_at.isoformat() + "Z" if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() + "Z" if self.finished_at else None,
+            "error": self.error
+        }
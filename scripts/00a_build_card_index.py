@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+import os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.card_index import CardIndex
+from api.catalog import GENE, FeatureCatalog
+
+# Pre-resolves every gene feature in the training templates against CARD so
+# the tBLASTn stage only does index lookups. Run once at image build; genes
+# ABRicate reports outside the templates are still resolved on first use.
+CARD_PROTEIN_FILE = os.getenv('CARD_PROTEIN_FILE', '/app/card_db/card_all_proteins.fasta')
+CARD_INDEX_DIR = os.getenv('CARD_INDEX_DIR', '/app/card_db/index')
+TEMPLATE_DIR = os.getenv('FEATURE_TEMPLATES_DIR', '/app/feature_templates')
+
+genes = FeatureCatalog.load(TEMPLATE_DIR).of_type(GENE)
+
+print(f"Template genes: {len(genes)}")
+t_start = time.time()
+card_index = CardIndex(CARD_PROTEIN_FILE, CARD_INDEX_DIR)
+scanned = card_index.resolve(genes)
+matched = sum(1 for gene in genes if card_index.genes[gene])
+print(f"  Scanned: {scanned}, matched in CARD: {matched}/{len(genes)}")
+print(f"✓ Saved: {card_index.index_file} ({time.time() - t_start:.1f}s)")
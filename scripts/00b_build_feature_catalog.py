@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+import os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.catalog import FeatureCatalog
+
+# Compiles feature_templates/*.txt into the feature catalog: one integer id
+# and type per feature plus each template's column order, as memory-mapped
+# arrays. Run once at image build; stages and API workers otherwise compile
+# it on first use and again whenever a template changes.
+TEMPLATE_DIR = os.getenv('FEATURE_TEMPLATES_DIR', '/app/feature_templates')
+
+t_start = time.time()
+catalog = FeatureCatalog.load(TEMPLATE_DIR)
+status = catalog.status()
+print(f"Features: {status['features']} ({', '.join(f'{n} {t}' for t, n in status['by_type'].items())})")
+for filename, length in catalog.templates.items():
+    print(f"  {filename}: {length} columns")
+print(f"✓ Saved: {catalog.path} ({time.time() - t_start:.1f}s)")
@@ -0,0 +1,133 @@
+#!/bin/bash
+# Prepares the Snippy reference once into SNIPPY_REFERENCE_DIR so the SNP
+# stage only aligns and calls variants per genome. Snippy has no option to
+# reuse a reference, so it is run once with the reference's own sequence as
+# contigs and the reference/ folder it builds (ref.fa, ref.gff, BWA and
+# samtools indexes, snpEff database) is kept. Run at image build, or by hand
+# after changing the reference or Snippy; the API only checks the stamp and
+# reports it under /readyz.
+#
+# 04_extract_snps.sh calls variants against this directory with Snippy's
+# steps spelled out, so before the directory is published both paths are run
+# on a copy of the reference with known substitutions, and their snps.tab
+# calls (CHROM, POS, TYPE, REF, ALT) must match exactly.
+REFERENCE="${REFERENCE_GENOME:-/app/reference/salmonella_LT2.gbff}"
+REF_DIR="${SNIPPY_REFERENCE_DIR:-/app/reference/snippy}"
+SNIPPY_CPUS="${SNIPPY_CPUS:-4}"
+# Regions freebayes-parallel splits the reference into, one per job thread
+CHUNK_SIZE=1000000
+SCRIPTS_DIR=$(dirname "$(readlink -f "$0")")
+
+echo "============================================================"
+echo "SCRIPT 0c: PREPARE SNIPPY REFERENCE"
+echo "============================================================"
+
+if [ ! -f "$REFERENCE" ]; then
+    echo "✗ ERROR: Reference genome not found: $REFERENCE"
+    exit 1
+fi
+
+for tool in snippy any2fasta fasta_generate_regions.py; do
+    if ! command -v "$tool" > /dev/null; then
+        echo "✗ ERROR: $tool not found"
+        exit 1
+    fi
+done
+
+# One preparation at a time; a second caller waits and then finds it current
+PARENT=$(dirname "$REF_DIR")
+mkdir -p "$PARENT"
+exec 9> "$PARENT/.snippy_reference.lock"
+flock 9
+
+# The stamp names the reference and the Snippy build it was verified with;
+# 04_extract_snps.sh only uses a directory whose stamp matches both
+STAMP="$(stat -c '%s %Y' "$REFERENCE") $REFERENCE
+$(snippy --version 2>&1)"
+if [ -f "$REF_DIR/.prepared" ] && [ "$(cat "$REF_DIR/.prepared")" == "$STAMP" ]; then
+    echo "✓ Already prepared: $REF_DIR"
+    exit 0
+fi
+
+TMP_DIR=$(mktemp -d "$PARENT/.snippy_reference.tmp.XXXXXX")
+trap 'rm -rf "$TMP_DIR"' EXIT
+
+echo "[1/4] Extracting reference contigs..."
+any2fasta -q "$REFERENCE" > "$TMP_DIR/contigs.fa"
+if [ $? -ne 0 ] || [ ! -s "$TMP_DIR/contigs.fa" ]; then
+    echo "✗ ERROR: Could not read sequence from $REFERENCE"
+    exit 1
+fi
+
+echo "[2/4] Running Snippy against itself..."
+snippy --outdir "$TMP_DIR/run" --ref "$REFERENCE" \
+    --ctgs "$TMP_DIR/contigs.fa" --cpus "$SNIPPY_CPUS" --force > "$TMP_DIR/snippy.log" 2>&1
+
+if [ $? -ne 0 ] || [ ! -f "$TMP_DIR/run/reference/ref.fa.bwt" ]; then
+    tail -5 "$TMP_DIR/snippy.log"
+    echo "✗ ERROR: Snippy failed"
+    exit 1
+fi
+
+mv "$TMP_DIR/run/reference" "$TMP_DIR/reference"
+fasta_generate_regions.py "$TMP_DIR/reference/ref.fa.fai" "$CHUNK_SIZE" > "$TMP_DIR/reference/ref.txt"
+echo "$STAMP" > "$TMP_DIR/reference/.prepared"
+
+echo "[3/4] Checking the prepared path against plain Snippy..."
+# Transitions at column 30 of every 500th sequence line
+mkdir -p "$TMP_DIR/check/prepared" "$TMP_DIR/check/snippy"
+awk 'BEGIN { t["A"]="G"; t["G"]="A"; t["C"]="T"; t["T"]="C" }
+     /^>/ { print; next }
+     { n++; b = toupper(substr($0, 30, 1)) }
+     n % 500 == 0 && (b in t) { $0 = substr($0, 1, 29) t[b] substr($0, 31) }
+     { print }' "$TMP_DIR/contigs.fa" > "$TMP_DIR/check/prepared/query_genome.fna"
+cp "$TMP_DIR/check/prepared/query_genome.fna" "$TMP_DIR/check/snippy/query_genome.fna"
+(cd "$TMP_DIR/check/prepared" && SNIPPY_REFERENCE_DIR="$TMP_DIR/reference" \
+    bash "$SCRIPTS_DIR/04_extract_snps.sh" > /dev/null) &&
+(cd "$TMP_DIR/check/snippy" && SNIPPY_REFERENCE_DIR="$TMP_DIR/none" \
+    bash "$SCRIPTS_DIR/04_extract_snps.sh" > /dev/null)
+if [ $? -ne 0 ]; then
+    tail -5 "$TMP_DIR"/check/*/logs/04_extract_snps.log
+    echo "✗ ERROR: SNP extraction failed on the check genome"
+    exit 1
+fi
+cut -f1-5 "$TMP_DIR/check/prepared/snippy_production_out/snps.tab" > "$TMP_DIR/check/prepared.calls"
+cut -f1-5 "$TMP_DIR/check/snippy/snippy_production_out/snps.tab" > "$TMP_DIR/check/snippy.calls"
+CALLS=$(($(wc -l < "$TMP_DIR/check/snippy.calls") - 1))
+if [ "$CALLS" -lt 1 ]; then
+    echo "✗ ERROR: Snippy called no variants on the check genome"
+    exit 1
+fi
+if ! diff -q "$TMP_DIR/check/snippy.calls" "$TMP_DIR/check/prepared.calls" > /dev/null; then
+    diff "$TMP_DIR/check/snippy.calls" "$TMP_DIR/check/prepared.calls" | head -10
+    echo "✗ ERROR: Prepared-reference calls differ from Snippy; not publishing $REF_DIR"
+    exit 1
+fi
+echo "  ✓ $CALLS calls identical"
+
+echo "[4/4] Installing into $REF_DIR..."
+chmod -R a-w "$TMP_DIR/reference"
+
+# REF_DIR is a symlink to a versioned directory and is swapped with a rename,
+# so jobs see the old or the new reference, never neither or a nested one.
+# 04_extract_snps.sh resolves the link once per job; the previous version is
+# kept for jobs still using it, older ones are removed.
+VERSION_DIR="$PARENT/.snippy_reference.$(date +%s).$$"
+mv "$TMP_DIR/reference" "$VERSION_DIR"
+PREVIOUS=$(readlink -f "$REF_DIR")
+if [ -d "$REF_DIR" ] && [ ! -L "$REF_DIR" ]; then
+    # A plain directory left by an older version of this script
+    mv "$REF_DIR" "$TMP_DIR/old"
+    chmod -R u+w "$TMP_DIR/old"
+    PREVIOUS=
+fi
+ln -sfn "$(basename "$VERSION_DIR")" "$TMP_DIR/link"
+mv -T "$TMP_DIR/link" "$REF_DIR"
+for old in "$PARENT"/.snippy_reference.[0-9]*; do
+    if [ "$old" != "$VERSION_DIR" ] && [ "$old" != "$PREVIOUS" ]; then
+        chmod -R u+w "$old" && rm -rf "$old"
+    fi
+done
+
+echo "  ✓ Prepared: $(ls "$REF_DIR" | tr '\n' ' ')"
+echo "============================================================"
@@ -1,11 +1,19 @@
 #!/bin/bash
+# Usage: 01_extract_genes.sh [card|resfinder|summary|all]
+# The card and resfinder steps are independent and may run concurrently;
+# summary needs both of their outputs. Default runs all three in order.
+STEP="${1:-all}"
 WORK_DIR=$(pwd)
 LOG_DIR="$WORK_DIR/logs"
-LOG_FILE="$LOG_DIR/01_extract_genes.log"
+if [ "$STEP" == "all" ]; then
+    LOG_FILE="$LOG_DIR/01_extract_genes.log"
+else
+    LOG_FILE="$LOG_DIR/01_extract_genes_$STEP.log"
+fi
 mkdir -p "$LOG_DIR"
 
 echo "============================================================" | tee "$LOG_FILE"
-echo "SCRIPT 1: GENE EXTRACTION" | tee -a "$LOG_FILE"
+echo "SCRIPT 1: GENE EXTRACTION ($STEP)" | tee -a "$LOG_FILE"
 echo "Started: $(date)" | tee -a "$LOG_FILE"
 echo "============================================================" | tee -a "$LOG_FILE"
 
@@ -15,15 +23,33 @@ if [ ! -f "query_genome.fna" ]; then
 fi
 
 echo "✓ Input genome found" | tee -a "$LOG_FILE"
-echo "[1/3] Running ABRicate (CARD)..." | tee -a "$LOG_FILE"
-abricate --db card query_genome.fna > card_production.tsv 2>> "$LOG_FILE"
-echo "  ✓ CARD done" | tee -a "$LOG_FILE"
 
-echo "[2/3] Running ABRicate (ResFinder)..." | tee -a "$LOG_FILE"
-abricate --db resfinder query_genome.fna > resfinder_production.tsv 2>> "$LOG_FILE"
-echo "  ✓ ResFinder done" | tee -a "$LOG_FILE"
+run_card() {
+    echo "[1/3] Running ABRicate (CARD)..." | tee -a "$LOG_FILE"
+    abricate --db card query_genome.fna > card_production.tsv 2>> "$LOG_FILE" || exit 1
+    echo "  ✓ CARD done" | tee -a "$LOG_FILE"
+}
+
+run_resfinder() {
+    echo "[2/3] Running ABRicate (ResFinder)..." | tee -a "$LOG_FILE"
+    abricate --db resfinder query_genome.fna > resfinder_production.tsv 2>> "$LOG_FILE" || exit 1
+    echo "  ✓ ResFinder done" | tee -a "$LOG_FILE"
+}
 
-echo "[3/3] Creating summary..." | tee -a "$LOG_FILE"
-abricate --summary card_production.tsv resfinder_production.tsv > gene_summary_production.tsv 2>> "$LOG_FILE"
-echo "  ✓ Summary created" | tee -a "$LOG_FILE"
-echo "============================================================" | tee -a "$LOG_FILE"
\ No newline at end of file
+run_summary() {
+    echo "[3/3] Creating summary..." | tee -a "$LOG_FILE"
+    abricate --summary card_production.tsv resfinder_production.tsv > gene_summary_production.tsv 2>> "$LOG_FILE" || exit 1
+    echo "  ✓ Summary created" | tee -a "$LOG_FILE"
+}
+
+case "$STEP" in
+    card) run_card ;;
+    resfinder) run_resfinder ;;
+    summary) run_summary ;;
+    all) run_card; run_resfinder; run_summary ;;
+    *)
+        echo "✗ ERROR: unknown step '$STEP' (expected card, resfinder, summary or all)" | tee -a "$LOG_FILE"
+        exit 1
+        ;;
+esac
+echo "============================================================" | tee -a "$LOG_FILE"
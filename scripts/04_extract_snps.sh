@@ -4,6 +4,18 @@ LOG_DIR="$WORK_DIR/logs"
 LOG_FILE="$LOG_DIR/04_extract_snps.log"
 SNIPPY_OUTDIR="$WORK_DIR/snippy_production_out"
 REFERENCE="${REFERENCE_GENOME:-/app/reference/salmonella_LT2.gbff}"
+# Reference prepared once by 00c_prepare_reference.sh; without it Snippy
+# converts and indexes the reference again for every genome
+REF_DIR="${SNIPPY_REFERENCE_DIR:-/app/reference/snippy}"
+SNIPPY_CPUS="${SNIPPY_CPUS:-4}"
+# Snippy's defaults, which the prepared path reproduces; 00c_prepare_reference.sh
+# only publishes a reference after this path matched plain Snippy on a test genome
+MIN_COV=10
+MIN_FRAC=0.9
+MIN_QUAL=100
+MAP_QUAL=60
+BASE_QUAL=13
+READ_LEN=250
 mkdir -p "$LOG_DIR"
 
 echo "============================================================" | tee "$LOG_FILE"
@@ -26,9 +38,69 @@ if [ -d "$SNIPPY_OUTDIR" ]; then
     rm -rf "$SNIPPY_OUTDIR"
 fi
 
-echo "[1/2] Running Snippy..." | tee -a "$LOG_FILE"
-snippy --outdir "$SNIPPY_OUTDIR" --ref "$REFERENCE" \
-    --ctgs query_genome.fna --cpus 4 --force >> "$LOG_FILE" 2>&1
+shred_contigs() {
+    # Contigs -> pseudo-reads tiled over both strands at 2x MIN_COV, as snippy --ctgs does
+    awk -v len="$READ_LEN" -v stride=$((READ_LEN / (2 * MIN_COV))) '
+        BEGIN { comp["A"]="T"; comp["C"]="G"; comp["G"]="C"; comp["T"]="A" }
+        function revcomp(s,    r, i, b) {
+            r = ""
+            for (i = length(s); i > 0; i--) { b = substr(s, i, 1); r = r ((b in comp) ? comp[b] : "N") }
+            return r
+        }
+        function emit(name, seq,    n, i, read, qual) {
+            n = length(seq)
+            for (i = 1; i == 1 || i + len - 1 <= n; i += stride) {
+                read = substr(seq, i, len)
+                qual = read; gsub(/./, "I", qual)
+                if (int(i / stride) % 2) read = revcomp(read)
+                printf "@%s_%d\n%s\n+\n%s\n", name, i, read, qual
+            }
+        }
+        /^>/ { if (seq != "") emit(name, seq); name = substr($1, 2); seq = ""; next }
+        { seq = seq toupper($0) }
+        END { if (seq != "") emit(name, seq) }
+    ' "$WORK_DIR/query_genome.fna"
+}
+
+run_prepared() {
+    set -o pipefail
+    local ref="$REF_DIR/ref.fa"
+    mkdir -p "$SNIPPY_OUTDIR"
+    cd "$SNIPPY_OUTDIR" || return 1
+    # Reads are streamed into BWA; at 2x MIN_COV they would be ~40x the genome on disk
+    shred_contigs \
+        | bwa mem -v 2 -Y -M -R "@RG\tID:snps\tSM:snps" -t "$SNIPPY_CPUS" "$ref" /dev/stdin \
+        | samclip --max 10 --ref "$ref.fai" \
+        | samtools sort -n -l 0 -T tmp -@ "$SNIPPY_CPUS" \
+        | samtools fixmate -m - - \
+        | samtools sort -l 0 -T tmp -@ "$SNIPPY_CPUS" \
+        | samtools markdup -T tmp -r -s - - > snps.bam || return 1
+    samtools index snps.bam || return 1
+    freebayes-parallel "$REF_DIR/ref.txt" "$SNIPPY_CPUS" -p 2 -P 0 -C "$MIN_COV" \
+        --min-repeat-entropy 1.5 --strict-vcf -q "$BASE_QUAL" -m "$MAP_QUAL" \
+        --min-coverage "$MIN_COV" -F 0.05 -f "$ref" snps.bam > snps.raw.vcf || return 1
+    bcftools view --include "FMT/GT=\"1/1\" && QUAL>=$MIN_QUAL && FMT/DP>=$MIN_COV && (FMT/AO)/(FMT/DP)>=$MIN_FRAC" snps.raw.vcf \
+        | vt normalize -r "$ref" - \
+        | bcftools annotate --remove '^INFO/TYPE,^INFO/DP,^INFO/RO,^INFO/AO,^INFO/AB,^FORMAT/GT,^FORMAT/DP,^FORMAT/RO,^FORMAT/AO,^FORMAT/QR,^FORMAT/QA,^FORMAT/GL' \
+        > snps.filt.vcf || return 1
+    snpEff ann -noLog -noStats -no-downstream -no-upstream -no-utr \
+        -c "$REF_DIR/snpeff.config" -dataDir . ref snps.filt.vcf > snps.vcf || return 1
+    snippy-vcf_to_tab --gff "$REF_DIR/ref.gff" --ref "$ref" --vcf snps.vcf > snps.tab || return 1
+}
+
+# Same stamp as 00c_prepare_reference.sh writes: reference file and Snippy build
+STAMP="$(stat -c '%s %Y' "$REFERENCE") $REFERENCE
+$(snippy --version 2>&1)"
+# Resolve the link once so a concurrent 00c_prepare_reference.sh cannot swap it mid-job
+REF_DIR=$(readlink -f "$REF_DIR" || echo "$REF_DIR")
+if [ -f "$REF_DIR/.prepared" ] && [ "$(cat "$REF_DIR/.prepared")" == "$STAMP" ]; then
+    echo "[1/2] Aligning against prepared reference: $REF_DIR" | tee -a "$LOG_FILE"
+    ( run_prepared ) >> "$LOG_FILE" 2>&1
+else
+    echo "[1/2] Running Snippy (no current prepared reference in $REF_DIR)..." | tee -a "$LOG_FILE"
+    snippy --outdir "$SNIPPY_OUTDIR" --ref "$REFERENCE" \
+        --ctgs query_genome.fna --cpus "$SNIPPY_CPUS" --force >> "$LOG_FILE" 2>&1
+fi
 
 if [ $? -ne 0 ]; then
     echo "✗ ERROR: Snippy failed" | tee -a "$LOG_FILE"
@@ -37,6 +109,10 @@ fi
 
 echo "  ✓ Snippy done" | tee -a "$LOG_FILE"
 
+# Only the variant calls are read downstream; drop the BAM, pseudo-reads,
+# consensus and reference copies now rather than when the job ends
+find "$SNIPPY_OUTDIR" -mindepth 1 -maxdepth 1 ! -name snps.tab ! -name snps.vcf -exec rm -rf {} +
+
 if [ ! -f "$SNIPPY_OUTDIR/snps.tab" ]; then
     echo "✗ ERROR: snps.tab not found" | tee -a "$LOG_FILE"
     exit 1
@@ -1,60 +1,15 @@
 #!/usr/bin/env python3
-import os, sys, pandas as pd
-
-WORK_DIR = os.getcwd()
-LOG_FILE = os.path.join(WORK_DIR, "logs", "04b_process_snps.log")
-SNIPPY_TAB = os.path.join(WORK_DIR, "snippy_production_out", "snps.tab")
-TEMPLATE_DIR = os.getenv('FEATURE_TEMPLATES_DIR', '/app/feature_templates')
-
-def log(msg):
-    print(msg)
-    with open(LOG_FILE, 'a') as f:
-        f.write(msg + '\n')
-
-with open(LOG_FILE, 'w') as f:
-    f.write("SCRIPT 4b: PROCESS SNPs\n")
-
-if not os.path.exists(SNIPPY_TAB):
-    log(f"✗ ERROR: {SNIPPY_TAB} not found")
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.stages import StageFailure, process_snps
+
+# Usage: 04b_process_snps.py [VARIANTS]  (run inside a job directory)
+#   VARIANTS  Snippy snps.tab (default snippy_production_out/snps.tab) or snps.vcf
+# Variants are streamed and matched against a (chrom, pos) -> {ref>alt: feature}
+# table over the SNPs of the compiled feature catalog; the API runs the same
+# function (api.stages.process_snps) in its warm stage workers.
+try:
+    process_snps(os.getcwd(), sys.argv[1] if len(sys.argv) > 1 else None, echo=True)
+except StageFailure:
     sys.exit(1)
-
-log("Loading training SNP feature list...")
-training_snps = set()
-for feat_file in ['features_snps_only.txt', 'features_genes_snps.txt', 'features_snps_kmers.txt', 'features_full_dataset.txt']:
-    path = os.path.join(TEMPLATE_DIR, feat_file)
-    if os.path.exists(path):
-        with open(path, 'r') as f:
-            for line in f:
-                feat = line.strip()
-                if '>' in feat and feat.startswith('NC_'):
-                    training_snps.add(feat)
-
-log(f"  Training SNPs: {len(training_snps)}")
-
-log("Parsing Snippy output...")
-snp_tab = pd.read_csv(SNIPPY_TAB, sep='\t', dtype=str)
-log(f"  Raw variants: {len(snp_tab)}")
-
-snp_row = {'Genome_ID': 'query_genome'}
-matched_snps = 0
-
-for _, row in snp_tab.iterrows():
-    try:
-        chrom = str(row['CHROM']).strip().split('.')[0]
-        pos = str(row['POS']).strip()
-        ref = str(row['REF']).strip()
-        alt = str(row['ALT']).strip()
-        
-        if any(v in ['nan', 'NaN', '', '.'] for v in [chrom, pos, ref, alt]):
-            continue
-        
-        feature_name = f"{chrom}_{pos}_{ref}>{alt}"
-        if feature_name in training_snps:
-            snp_row[feature_name] = 1
-            matched_snps += 1
-    except:
-        continue
-
-log(f"  SNPs matching training: {matched_snps}")
-pd.DataFrame([snp_row]).to_csv('snp_production.csv', index=False)
-log("✓ Saved: snp_production.csv")
\ No newline at end of file
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+import argparse, asyncio, contextlib, csv, io, json, os, platform, resource, runpy, shutil, subprocess, sys, tempfile, time, warnings
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.card_index import CardIndex
+from api.features import FeatureTemplates, read_genome_features, read_hits, stack
+from api.pipeline import FEATURE_STAGES, PIPELINE_CPUS, SCRIPTS_DIR, STAGES, run_pipeline
+from api.registry import ModelRegistry, model_paths
+from api.warmup import import_modules
+
+# Usage: 05_benchmark.py [--genomes FASTA_OR_DIR ...] [--repeats N] [--suites stages combinations micro]
+#                        [--fixtures DIR] [--record DIR] [--out PREFIX]
+#   stages        every pipeline stage run on its own, in dependency order: wall, CPU and peak RSS
+#   combinations  the stage DAG as the API runs it, once per feature combination (measured, not summed)
+#   micro         the in-Python hot paths replayed on recorded stage outputs; no external tools needed
+# Results go to PREFIX.json (config, raw samples, summary) and PREFIX.csv (summary percentiles).
+MODELS_DIR = os.getenv('MODELS_DIR', '/app/models')
+TEMPLATE_DIR = os.getenv('FEATURE_TEMPLATES_DIR', '/app/feature_templates')
+CARD_PROTEIN_FILE = os.getenv('CARD_PROTEIN_FILE', '/app/card_db/card_all_proteins.fasta')
+CARD_INDEX_DIR = os.getenv('CARD_INDEX_DIR', '/app/card_db/index')
+
+PARTIAL_TEMPLATES = {"pefoxacin": "snps_kmers", "trimethoprim": "snps_kmers", "sulfamethoxazole": "genes_snps"}
+# Stages each feature combination needs; the DAG adds their dependencies
+COMBINATIONS = {
+    "genes": ["process_genes"],
+    "snps": ["process_snps"],
+    "kmers": ["kmers"],
+    "genes_snps": ["process_genes", "process_snps"],
+    "genes_kmers": ["process_genes", "kmers"],
+    "snps_kmers": ["process_snps", "kmers"],
+    "full": FEATURE_STAGES
+}
+# Stage outputs the micro suite replays (relative to a job work dir)
+FIXTURE_FILES = [
+    "gene_summary_production.tsv", "gene_presence_production.csv", "blast_production.tsv",
+    "kmer_production.csv", "snippy_production_out/snps.tab", "snp_production.csv"
+]
+PERCENTILES = (50, 90, 99)
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+# Children are started from this small interpreter, not from the benchmark process:
+# Linux carries a forked parent's RSS high-water mark across exec, which would
+# report the loaded models as every stage's peak RSS
+LAUNCHER = """
+import json, os, subprocess, sys, time
+start = time.perf_counter()
+proc = subprocess.Popen(sys.argv[1:], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+_, status, usage = os.wait4(proc.pid, 0)
+print(json.dumps({"wall_s": time.perf_counter() - start, "cpu_s": usage.ru_utime + usage.ru_stime,
+                  "peak_rss_mb": usage.ru_maxrss / 1024, "returncode": os.waitstatus_to_exitcode(status)}))
+"""
+
+def log(msg):
+    print(msg, flush=True)
+
+def genome_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, f) for f in os.listdir(path)
+                                if f.endswith(('.fna', '.fasta', '.fa'))))
+        else:
+            files.append(path)
+    return files
+
+def new_work_dir(genome):
+    work = tempfile.mkdtemp(prefix="bench_")
+    shutil.copyfile(genome, os.path.join(work, "query_genome.fna"))
+    return work
+
+def run_child(cmd, cwd, env):
+    """Run cmd to completion; wall/CPU seconds and peak RSS of it and its waited-for children"""
+    out = subprocess.run([sys.executable, "-c", LAUNCHER, *cmd], cwd=cwd, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    sample = json.loads(out)
+    returncode = sample.pop("returncode")
+    if returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd[1:])} exited with {returncode} (see {cwd}/logs)")
+    return sample
+
+@contextlib.contextmanager
+def measured(sample):
+    """Fill sample with wall/CPU seconds of the with-block run in this process"""
+    wall, cpu = time.perf_counter(), time.process_time()
+    yield sample
+    sample["wall_s"] = time.perf_counter() - wall
+    sample["cpu_s"] = time.process_time() - cpu
+    # Process-lifetime high-water mark, not the block's own peak
+    sample["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def record_fixtures(work, fixtures_dir):
+    for rel in FIXTURE_FILES:
+        src = os.path.join(work, rel)
+        if os.path.exists(src):
+            dst = os.path.join(fixtures_dir, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copyfile(src, dst)
+    log(f"  Recorded fixtures: {fixtures_dir}")
+
+# ---------------------------------------------------------------- scoring
+
+class Scorer:
+    """Templates, models and explainers loaded once, as in a warm API worker"""
+
+    def __init__(self):
+        import_modules()
+        self.templates = FeatureTemplates(TEMPLATE_DIR).load_all()
+        self.registry = ModelRegistry(model_paths(MODELS_DIR)).load_all(explainers=True)
+
+    def template_for(self, model_name):
+        antibiotic, kind = model_name.rsplit("_", 1)
+        return "full" if kind == "full" else PARTIAL_TEMPLATES[antibiotic]
+
+    def align(self, feature_sets):
+        return {name: stack([self.templates.get(name).align(f.hits) for f in feature_sets])
+                for name in self.templates.paths}
+
+    def predict_proba(self, aligned):
+        return {name: self.registry.model(name).predict_proba(aligned[self.template_for(name)])
+                for name in self.registry.paths}
+
+    def shap(self, aligned):
+        return {name: self.registry.get(name).explainer().explain(aligned[self.template_for(name)])
+                for name in self.registry.paths}
+
+    def score(self, work):
+        features = [read_genome_features(work)]
+        aligned = self.align(features)
+        self.predict_proba(aligned)
+        self.shap(aligned)
+
+# ---------------------------------------------------------------- suites
+
+def stage_env(stage, cpus):
+    env = dict(os.environ)
+    if stage.threads_env:
+        env[stage.threads_env] = str(cpus)
+    return env
+
+def suite_stages(genomes, repeats, cpus, scorer, record):
+    samples = []
+    for genome in genomes:
+        for rep in range(repeats):
+            work = new_work_dir(genome)
+            try:
+                for stage in STAGES:
+                    cmd = [stage.interpreter, str(SCRIPTS_DIR / stage.script), *stage.args]
+                    sample = run_child(cmd, work, stage_env(stage, cpus))
+                    samples.append(dict(suite="stages", name=stage.name, genome=genome, rep=rep, **sample))
+                sample = {}
+                with measured(sample):
+                    scorer.score(work)
+                samples.append(dict(suite="stages", name="predict", genome=genome, rep=rep, **sample))
+                if record and rep == 0 and genome == genomes[0]:
+                    record_fixtures(work, record)
+            finally:
+                shutil.rmtree(work, ignore_errors=True)
+        log(f"  stages: {os.path.basename(genome)} x{repeats}")
+    return samples
+
+def suite_combinations(genomes, repeats, cpus):
+    samples = []
+    for genome in genomes:
+        for name, targets in COMBINATIONS.items():
+            for rep in range(repeats):
+                work = new_work_dir(genome)
+                try:
+                    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+                    start = time.perf_counter()
+                    asyncio.run(run_pipeline(work, cpus=cpus, targets=targets))
+                    wall = time.perf_counter() - start
+                    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+                    samples.append({
+                        "suite": "combinations", "name": name, "genome": genome, "rep": rep, "wall_s": wall,
+                        "cpu_s": (after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime)
+                    })
+                finally:
+                    shutil.rmtree(work, ignore_errors=True)
+        log(f"  combinations: {os.path.basename(genome)} x{repeats}")
+    return samples
+
+def replay_script(fixtures, script, args=()):
+    """Run a stage script in this process against a scratch copy of the fixtures"""
+    work = tempfile.mkdtemp(prefix="bench_micro_")
+    cwd, argv = os.getcwd(), sys.argv
+    try:
+        shutil.copytree(fixtures, work, dirs_exist_ok=True)
+        os.chdir(work)
+        sys.argv = [script, *args]
+        sample = {}
+        with contextlib.redirect_stdout(io.StringIO()), measured(sample):
+            runpy.run_path(str(SCRIPTS_DIR / script), run_name="__main__")
+        return sample
+    finally:
+        os.chdir(cwd)
+        sys.argv = argv
+        shutil.rmtree(work, ignore_errors=True)
+
+def card_filter(genes):
+    """Query FASTA for genes from the persisted index"""
+    scratch = tempfile.mkdtemp(prefix="bench_card_")
+    try:
+        index_file = os.path.join(CARD_INDEX_DIR, "card_gene_index.json")
+        if os.path.exists(index_file):
+            shutil.copyfile(index_file, os.path.join(scratch, "card_gene_index.json"))
+        sample = {}
+        with measured(sample):
+            card_index = CardIndex(CARD_PROTEIN_FILE, scratch)
+            card_index.resolve(genes)
+            card_index.query_set(genes, os.path.join(scratch, "query.faa"))
+        return sample
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def suite_micro(fixtures, repeats, warmup, scorer):
+    genes = [feat for feat, _ in read_hits(os.path.join(fixtures, "gene_presence_production.csv"))]
+    features = [read_genome_features(fixtures)]
+    aligned = scorer.align(features)
+    benches = {
+        "card_filter": lambda: card_filter(genes),
+        "kmer_scan": lambda: replay_script(fixtures, "03_extract_kmers.py", ["kmers"]),
+        "snp_match": lambda: replay_script(fixtures, "04b_process_snps.py"),
+        "align": lambda: _in_process(scorer.align, features),
+        "predict_proba": lambda: _in_process(scorer.predict_proba, aligned),
+        "shap": lambda: _in_process(scorer.shap, aligned)
+    }
+    samples = []
+    for name, bench in benches.items():
+        for rep in range(warmup + repeats):
+            sample = bench()
+            if rep >= warmup:
+                samples.append(dict(suite="micro", name=name, genome=fixtures, rep=rep - warmup, **sample))
+        log(f"  micro: {name} x{repeats}")
+    return samples
+
+def _in_process(fn, *args):
+    sample = {}
+    with measured(sample):
+        fn(*args)
+    return sample
+
+# ---------------------------------------------------------------- report
+
+def summarize(samples):
+    groups = {}
+    for s in samples:
+        groups.setdefault((s["suite"], s["name"]), []).append(s)
+    rows = []
+    for (suite, name), group in groups.items():
+        for metric in ("wall_s", "cpu_s", "peak_rss_mb"):
+            values = np.array([s[metric] for s in group if metric in s], dtype=float)
+            if len(values) == 0:
+                continue
+            row = {"suite": suite, "name": name, "metric": metric, "n": len(values),
+                   "mean": values.mean(), "min": values.min(), "max": values.max()}
+            row.update({f"p{p}": np.percentile(values, p) for p in PERCENTILES})
+            rows.append({k: round(float(v), 6) if isinstance(v, (float, np.floating)) else v for k, v in row.items()})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the AMR pipeline stages and in-Python hot paths")
+    parser.add_argument("--genomes", nargs="+", default=["query_genome.fna"],
+                        help="FASTA files or directories of them (default: ./query_genome.fna)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1, help="untimed micro runs before the timed ones")
+    parser.add_argument("--suites", nargs="+", choices=["stages", "combinations", "micro"],
+                        default=["stages", "combinations"])
+    parser.add_argument("--fixtures", help="recorded stage outputs for the micro suite (see --record)")
+    parser.add_argument("--record", help="save the first genome's stage outputs here as micro fixtures")
+    parser.add_argument("--cpus", type=int, default=PIPELINE_CPUS)
+    parser.add_argument("--out", default="benchmark_results", help="output prefix for .json and .csv")
+    opts = parser.parse_args()
+
+    genomes = [os.path.abspath(g) for g in genome_files(opts.genomes)] if {"stages", "combinations"} & set(opts.suites) else []
+    fixtures = opts.fixtures or opts.record
+    if "micro" in opts.suites and not fixtures:
+        parser.error("the micro suite needs --fixtures (or --record together with the stages suite)")
+    for genome in genomes:
+        if not os.path.exists(genome):
+            parser.error(f"genome not found: {genome}")
+    if opts.record:
+        opts.record = os.path.abspath(opts.record)
+        os.makedirs(opts.record, exist_ok=True)
+
+    log("=" * 60)
+    log("SCRIPT 5: BENCHMARKING")
+    log(f"Started: {datetime.now()}")
+    log("=" * 60)
+    log(f"Genomes: {len(genomes)}, repeats: {opts.repeats}, suites: {' '.join(opts.suites)}, cpus: {opts.cpus}")
+
+    scorer = Scorer()
+    samples = []
+    if "stages" in opts.suites:
+        samples += suite_stages(genomes, opts.repeats, opts.cpus, scorer, opts.record)
+    if "combinations" in opts.suites:
+        samples += suite_combinations(genomes, opts.repeats, opts.cpus)
+    if "micro" in opts.suites:
+        samples += suite_micro(os.path.abspath(fixtures), opts.repeats, opts.warmup, scorer)
+
+    summary = summarize(samples)
+    config = {
+        "started": datetime.now().isoformat(), "genomes": genomes, "repeats": opts.repeats,
+        "suites": opts.suites, "cpus": opts.cpus, "fixtures": fixtures,
+        "python": platform.python_version(), "host": platform.node(), "cpu_count": os.cpu_count()
+    }
+    with open(f"{opts.out}.json", "w") as f:
+        json.dump({"config": config, "summary": summary, "samples": samples}, f, indent=2)
+    columns = ["suite", "name", "metric", "n", "mean"] + [f"p{p}" for p in PERCENTILES] + ["min", "max"]
+    with open(f"{opts.out}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(summary)
+
+    log("")
+    log(f"{'suite':<13} {'name':<20} {'p50 wall':>10} {'p99 wall':>10} {'p50 cpu':>10} {'peak rss':>10}")
+    by_key = {(r["suite"], r["name"], r["metric"]): r for r in summary}
+    for suite, name in dict.fromkeys((r["suite"], r["name"]) for r in summary):
+        wall, cpu = by_key[(suite, name, "wall_s")], by_key[(suite, name, "cpu_s")]
+        rss = by_key.get((suite, name, "peak_rss_mb"))
+        log(f"{suite:<13} {name:<20} {wall['p50']:>9.3f}s {wall['p99']:>9.3f}s {cpu['p50']:>9.3f}s "
+            f"{(str(round(rss['max'])) + 'MB') if rss else '-':>10}")
+    log("")
+    log(f"✓ Results saved to: {opts.out}.json, {opts.out}.csv")
+    log("=" * 60)
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
-import os, sys, pickle, json, pandas as pd
-import shap
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+import os, sys, json, warnings, pandas as pd
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.features import FeatureTemplates, HIT_FILES, read_genome_features
+from api.registry import ModelRegistry, model_paths
+from api.warmup import import_modules
+
 WORK_DIR = os.getcwd()
 MODELS_DIR = os.getenv('MODELS_DIR', '/app/models')
+TEMPLATE_DIR = os.getenv('FEATURE_TEMPLATES_DIR', '/app/feature_templates')
+PARTIAL_TEMPLATES = {"pefoxacin": "snps_kmers", "trimethoprim": "snps_kmers", "sulfamethoxazole": "genes_snps"}
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
 LOG_DIR = os.path.join(WORK_DIR, "logs")
 if not os.path.exists(LOG_DIR):
     os.makedirs(LOG_DIR)
@@ -26,64 +30,62 @@ with open(LOG_FILE, 'w') as f:
     f.write(f"Started: {datetime.now()}\n")
     f.write("="*60 + '\n')
 
-def get_shap_explanation(model, X, top_n=5):
-    explainer = shap.TreeExplainer(model)
-    shap_values = explainer.shap_values(X)
-    if isinstance(shap_values, list):
-        shap_values = shap_values[1]
+def get_shap_explanation(model_name, X, template, top_n=5):
+    shap_values, _ = registry.get(model_name).explainer().explain(X)
     
     feature_impacts = pd.DataFrame({
-        'feature': X.columns,
+        'feature': template.features,
         'shap_value': shap_values[0]
     }).sort_values('shap_value', key=abs, ascending=False)
     
     evidence = []
-    for _, row in feature_impacts.head(top_n).iterrows():
+    for column, row in feature_impacts.head(top_n).iterrows():
         feat = row['feature']
         impact = row['shap_value']
         direction = "promotes_resistance" if impact > 0 else "promotes_susceptibility"
-        feat_type = "SNP" if '>' in feat and 'NC_' in feat else ("K-mer" if len(feat)==10 and feat.isalpha() else "Gene")
         evidence.append({
             "feature": feat,
-            "type": feat_type,
+            "type": template.type_label(column),
             "impact_score": round(float(impact), 4),
             "effect": direction
         })
     return evidence
 
 log("Validating files...")
-required_files = ['aligned_full.csv', 'aligned_snps_kmers.csv', 'aligned_genes_snps.csv']
-for f in required_files:
+for f in HIT_FILES.values():
     if not os.path.exists(f):
         log(f"✗ ERROR: {f} not found")
         sys.exit(1)
 
 log("Loading features...")
-df_full = pd.read_csv('aligned_full.csv')
-df_snps_kmers = pd.read_csv('aligned_snps_kmers.csv')
-df_genes_snps = pd.read_csv('aligned_genes_snps.csv')
-genes_df = pd.read_csv('gene_presence_production.csv')
-kmers_df = pd.read_csv('kmer_production.csv')
-snps_df = pd.read_csv('snp_production.csv')
+features = read_genome_features(WORK_DIR)
+genome_id = features.genome_id
+templates = FeatureTemplates(TEMPLATE_DIR).load_all()
+aligned = {}
+for name in templates.paths:
+    template = templates.get(name)
+    X = template.align(features.hits)
+    aligned[name] = (X, template)
+    log(f"  {name}: matched {len(X)}/{len(template)} template features")
 
-genome_id = df_full['Genome_ID'].iloc[0]
-X_full = df_full.drop(columns=['Genome_ID'])
-X_snps_kmers = df_snps_kmers.drop(columns=['Genome_ID'])
-X_genes_snps = df_genes_snps.drop(columns=['Genome_ID'])
+log("Loading models...")
+for module, seconds in import_modules().items():
+    log(f"  Imported {module} in {seconds:.2f}s")
+registry = ModelRegistry(model_paths(MODELS_DIR)).load_all()
+log(f"  Loaded {len(registry.paths)} models in {registry.status()['total_load_seconds']:.2f}s")
 
 log("Running predictions with SHAP...")
 results = {}
 
 for antibiotic in ["pefoxacin", "trimethoprim", "sulfamethoxazole"]:
-    with open(os.path.join(MODELS_DIR, f'{antibiotic}_full_model.pkl'), 'rb') as f:
-        model_full = pickle.load(f)
-    with open(os.path.join(MODELS_DIR, f'{antibiotic}_snps_kmers_model.pkl' if antibiotic != "sulfamethoxazole" else f'{antibiotic}_genes_snps_model.pkl'), 'rb') as f:
-        model_partial = pickle.load(f)
+    model_full = registry.model(f"{antibiotic}_full")
+    model_partial = registry.model(f"{antibiotic}_partial")
     
-    X_partial = X_snps_kmers if antibiotic in ["pefoxacin", "trimethoprim"] else X_genes_snps
+    X_full, template_full = aligned["full"]
+    X_partial, template_partial = aligned[PARTIAL_TEMPLATES[antibiotic]]
     
-    proba_full = model_full.predict_proba(X_full)[0]
-    proba_partial = model_partial.predict_proba(X_partial)[0]
+    proba_full = model_full.predict_proba(X_full.to_csr())[0]
+    proba_partial = model_partial.predict_proba(X_partial.to_csr())[0]
     
     full_pred = "Resistant" if proba_full[1] >= 0.5 else "Susceptible"
     partial_pred = "Resistant" if proba_partial[1] >= 0.5 else "Susceptible"
@@ -96,22 +98,26 @@ for antibiotic in ["pefoxacin", "trimethoprim", "sulfamethoxazole"]:
         consensus = f"Models disagree: Full={full_pred} ({proba_full[1]:.1%}), Partial={partial_pred} ({proba_partial[1]:.1%})"
         best_model = model_full if proba_full[1] > proba_partial[1] else model_partial
         best_X = X_full if proba_full[1] > proba_partial[1] else X_partial
+        best_template = template_full if proba_full[1] > proba_partial[1] else template_partial
     else:
         final_pred = full_pred
         if proba_full[1] > proba_partial[1]:
             final_prob = proba_full[1] if final_pred == "Resistant" else proba_full[0]
             best_model = model_full
             best_X = X_full
+            best_template = template_full
         else:
             final_prob = proba_partial[1] if final_pred == "Resistant" else proba_partial[0]
             best_model = model_partial
             best_X = X_partial
+            best_template = template_partial
         
         confidence = "High" if final_prob >= 0.85 else ("Medium" if final_prob >= 0.65 else "Low")
         action = "REPORT_FINAL" if final_prob >= 0.85 else ("CONSIDER_CONFIRMATION" if final_prob >= 0.65 else "CONFIRMATORY_AST_REQUIRED")
         consensus = f"Both models agree ({final_prob:.1%} confident)"
     
-    evidence = get_shap_explanation(best_model, best_X, top_n=5)
+    best_name = f"{antibiotic}_full" if best_model is model_full else f"{antibiotic}_partial"
+    evidence = get_shap_explanation(best_name, best_X.to_csr(), best_template, top_n=5)
     
     log(f"\n{antibiotic.upper()}:")
     log(f"  Phenotype: {final_pred}")
@@ -139,9 +145,9 @@ output = {
     "genome_id": genome_id,
     "prediction_timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
     "quality_metrics": {
-        "genes_detected": int(genes_df.shape[1] - 1),
-        "kmers_matched": int(kmers_df.shape[1] - 1),
-        "snps_detected": int(snps_df.shape[1] - 1)
+        "genes_detected": features.counts["genes"],
+        "kmers_matched": features.counts["kmers"],
+        "snps_detected": features.counts["snps"]
     },
     "predictions": results,
     "model_metadata": {
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+import argparse, json, os, random, signal, socket, subprocess, sys, tempfile, threading, time, uuid
+import urllib.error, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+# Usage: 08_load_test.py [--url URL | --serve [--stub]] [--mix FILE] [--genomes FASTA_OR_DIR ...]
+#                        [--requests N | --duration S] [--concurrency C] [--rate R] [--out PREFIX]
+# Replays a request mix against the API and reports throughput, latency percentiles,
+# error/timeout/429 rates and queueing delay (client-side wait for a free connection
+# and server-side wait for a job slot).
+#   --serve  start uvicorn (api.app:app) on a free port for the run
+#   --stub   (implies --serve) put scripts/load_test/stubs first on PATH: abricate,
+#            makeblastdb, tblastn and snippy replay scripts/load_test/fixtures, so API and
+#            scheduler overhead can be load-tested without the bioinformatics tools
+#            (Snippy's own toolchain is stubbed only so /readyz finds it);
+#            STUB_TOOL_SECONDS / STUB_<TOOL>_SECONDS simulate tool run time
+# Mix file: one JSON object per line, picked at random in proportion to "weight":
+#   {"endpoint": "/predict", "params": {"plots": "true"}, "weight": 8}
+#   {"endpoint": "/jobs", "weight": 2}
+#   {"endpoint": "/predict/batch", "genomes": 4, "weight": 1}
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOAD_TEST_DIR = os.path.join(REPO_DIR, "scripts", "load_test")
+DEFAULT_MIX = os.path.join(LOAD_TEST_DIR, "mix.jsonl")
+DEFAULT_GENOME = os.path.join(LOAD_TEST_DIR, "fixtures", "genome.fna")
+PERCENTILES = (50, 90, 99)
+
+def log(msg):
+    print(msg, flush=True)
+
+def genome_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, f) for f in os.listdir(path)
+                                if f.endswith(('.fna', '.fasta', '.fa'))))
+        else:
+            files.append(path)
+    return files
+
+def load_mix(path):
+    with open(path) as f:
+        mix = [json.loads(line) for line in f if line.strip()]
+    for entry in mix:
+        if entry.get("endpoint") not in ("/predict", "/jobs", "/predict/batch"):
+            raise ValueError(f"{path}: unsupported endpoint in {entry}")
+    return mix
+
+def parse_time(value):
+    return datetime.fromisoformat(value.rstrip("Z")) if value else None
+
+# ---------------------------------------------------------------- HTTP
+
+class Client:
+    """Minimal urllib client; one request per call, safe to share across threads"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def url(self, path, params=None):
+        query = "&".join(f"{k}={v}" for k, v in (params or {}).items())
+        return f"{self.base_url}{path}" + (f"?{query}" if query else "")
+
+    def open(self, method, path, params=None, files=()):
+        """Response object for the request; HTTP errors come back as responses too"""
+        body, headers = None, {}
+        if files:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for field, (filename, content) in files:
+                parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; '
+                             f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode())
+                parts.append(content)
+                parts.append(b"\r\n")
+            parts.append(f"--{boundary}--\r\n".encode())
+            body = b"".join(parts)
+            headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+        request = urllib.request.Request(self.url(path, params), data=body, headers=headers, method=method)
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            return e
+
+    def json(self, method, path, params=None, files=()):
+        response = self.open(method, path, params, files)
+        with response:
+            return response.status, json.loads(response.read() or b"null")
+
+# ---------------------------------------------------------------- requests
+
+class GenomeSource:
+    """Round-robin genomes; unique mode appends a per-request contig so the result cache never hits"""
+
+    def __init__(self, paths, unique):
+        self.genomes = [(os.path.basename(p), open(p, 'rb').read()) for p in paths]
+        self.unique = unique
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            filename, content = self.genomes[self._next % len(self.genomes)]
+            self._next += 1
+            n = self._next
+        if self.unique:
+            content = content.rstrip(b"\n") + f"\n>loadtest_{n}_{uuid.uuid4().hex}\nACGT\n".encode()
+        return filename, content
+
+def server_queue_seconds(job):
+    timestamps = job.get("timestamps", {})
+    submitted, started = parse_time(timestamps.get("submitted_at")), parse_time(timestamps.get("started_at"))
+    return (started - submitted).total_seconds() if submitted and started else None
+
+def fetch_job(client, job_id, wait=0):
+    status, job = client.json("GET", f"/jobs/{job_id}", {"wait": wait} if wait else None)
+    return job if status == 200 else None
+
+def run_predict(client, entry, genomes, sample):
+    status, body = client.json("POST", "/predict", entry.get("params"), [("genome", genomes.take())])
+    sample["status"] = status
+    if status == 200:
+        sample["cached"] = body.get("cached", False)
+        sample["latency_s"] = time.perf_counter() - sample["_sent"]
+        job = fetch_job(client, body["job_id"])
+        if job:
+            sample["server_queue_s"] = server_queue_seconds(job)
+    else:
+        sample["error"] = body.get("detail") if isinstance(body, dict) else body
+
+def run_job(client, entry, genomes, sample):
+    status, body = client.json("POST", "/jobs", entry.get("params"), [("genome", genomes.take())])
+    sample["status"] = status
+    if status != 202:
+        sample["error"] = body.get("detail") if isinstance(body, dict) else body
+        return
+    job = body
+    while job and job["status"] not in ("completed", "failed"):
+        job = fetch_job(client, job["job_id"], wait=30)
+    sample["latency_s"] = time.perf_counter() - sample["_sent"]
+    if job:
+        sample["server_queue_s"] = server_queue_seconds(job)
+        if job["status"] == "failed":
+            sample["status"] = job["error"]["status_code"]
+            sample["error"] = job["error"]["detail"]
+
+def run_batch(client, entry, genomes, sample):
+    files = [("genomes", genomes.take()) for _ in range(int(entry.get("genomes", 2)))]
+    response = client.open("POST", "/predict/batch", entry.get("params"), files)
+    sample["status"] = response.status
+    with response:
+        if response.status != 200:
+            sample["error"] = json.loads(response.read() or b"null")
+            return
+        for line in response:
+            record = json.loads(line)
+            if "predictions" in record and "first_result_s" not in sample:
+                sample["first_result_s"] = time.perf_counter() - sample["_sent"]
+            if record.get("status") == "finished":
+                sample["genomes"] = record["completed"] + record["failed"]
+                sample["genome_failures"] = record["failed"]
+    sample["latency_s"] = time.perf_counter() - sample["_sent"]
+
+RUNNERS = {"/predict": run_predict, "/jobs": run_job, "/predict/batch": run_batch}
+
+def execute(client, entry, genomes, arrival):
+    sample = {"endpoint": entry["endpoint"], "_sent": time.perf_counter()}
+    # Open-loop arrivals wait here when every connection is busy
+    sample["client_queue_s"] = sample["_sent"] - arrival if arrival is not None else 0.0
+    try:
+        RUNNERS[entry["endpoint"]](client, entry, genomes, sample)
+    except (socket.timeout, TimeoutError):
+        sample["status"] = "timeout"
+    except (urllib.error.URLError, ConnectionError) as e:
+        sample["status"] = "connection_error"
+        sample["error"] = str(e)
+    sample["finished_s"] = time.perf_counter()
+    sample.pop("_sent")
+    return sample
+
+# ---------------------------------------------------------------- driver
+
+def drive(client, mix, genomes, opts):
+    rng = random.Random(opts.seed)
+    weights = [entry.get("weight", 1) for entry in mix]
+    samples, futures = [], []
+    start = time.perf_counter()
+    next_arrival = start
+    with ThreadPoolExecutor(max_workers=opts.concurrency) as pool:
+        for i in range(opts.requests):
+            if opts.duration and time.perf_counter() - start >= opts.duration:
+                break
+            arrival = None
+            if opts.rate > 0:
+                # Poisson arrivals at the target rate, independent of response times
+                next_arrival += rng.expovariate(opts.rate)
+                time.sleep(max(next_arrival - time.perf_counter(), 0))
+                arrival = next_arrival
+            entry = rng.choices(mix, weights)[0]
+            futures.append(pool.submit(execute, client, entry, genomes, arrival))
+        for future in futures:
+            samples.append(future.result())
+    for sample in samples:
+        sample["finished_s"] -= start
+    return samples, time.perf_counter() - start
+
+def percentiles(values):
+    values = np.array([v for v in values if v is not None], dtype=float)
+    if len(values) == 0:
+        return None
+    stats = {f"p{p}": round(float(np.percentile(values, p)), 4) for p in PERCENTILES}
+    stats.update(mean=round(float(values.mean()), 4), max=round(float(values.max()), 4), n=len(values))
+    return stats
+
+def summarize(samples, duration):
+    n = len(samples)
+    ok = [s for s in samples if s["status"] in (200, 202)]
+    statuses = {}
+    for s in samples:
+        statuses[str(s["status"])] = statuses.get(str(s["status"]), 0) + 1
+    timeouts = sum(1 for s in samples if s["status"] in ("timeout", 504))
+    summary = {
+        "requests": n,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(ok) / duration, 4) if duration else None,
+        "genomes_per_s": round(sum(s.get("genomes", 1) for s in ok) / duration, 4) if duration else None,
+        "status_codes": statuses,
+        "error_rate": round((n - len(ok)) / n, 4) if n else None,
+        "timeout_rate": round(timeouts / n, 4) if n else None,
+        "rejected_rate": round(statuses.get("429", 0) / n, 4) if n else None,
+        "cached_rate": round(sum(1 for s in ok if s.get("cached")) / len(ok), 4) if ok else None,
+        "latency_s": percentiles(s.get("latency_s") for s in ok),
+        "client_queue_s": percentiles(s["client_queue_s"] for s in samples),
+        "server_queue_s": percentiles(s.get("server_queue_s") for s in ok),
+        "by_endpoint": {}
+    }
+    for endpoint in sorted({s["endpoint"] for s in samples}):
+        group = [s for s in samples if s["endpoint"] == endpoint]
+        group_ok = [s for s in group if s["status"] in (200, 202)]
+        summary["by_endpoint"][endpoint] = {
+            "requests": len(group),
+            "errors": len(group) - len(group_ok),
+            "latency_s": percentiles(s.get("latency_s") for s in group_ok),
+            "first_result_s": percentiles(s.get("first_result_s") for s in group_ok) if endpoint == "/predict/batch" else None
+        }
+    return summary
+
+# ---------------------------------------------------------------- server
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(opts):
+    port = free_port()
+    scratch = tempfile.mkdtemp(prefix="load_test_")
+    env = dict(os.environ)
+    for var, sub in (("WORK_DIR", "work"), ("RESULTS_DIR", "results"), ("CACHE_DIR", "cache"),
+                     ("CARD_INDEX_DIR", "card_index"), ("SNIPPY_REFERENCE_DIR", "snippy_reference")):
+        env.setdefault(var, os.path.join(scratch, sub))
+    # Data shipped in this checkout (the same paths as /app/... inside the image)
+    for var, path in (("SCRIPTS_DIR", "scripts"), ("MODELS_DIR", "models"),
+                      ("FEATURE_TEMPLATES_DIR", "feature_templates"),
+                      ("CARD_PROTEIN_FILE", "card_db/card_all_proteins.fasta")):
+        env.setdefault(var, os.path.join(REPO_DIR, path))
+    if opts.stub:
+        env["PATH"] = os.path.join(LOAD_TEST_DIR, "stubs") + os.pathsep + env.get("PATH", "")
+        env["REFERENCE_GENOME"] = os.path.join(LOAD_TEST_DIR, "fixtures", "reference.gbff")
+    cmd = [sys.executable, "-m", "uvicorn", "api.app:app", "--host", "127.0.0.1", "--port", str(port),
+           "--log-level", "warning"]
+    server = subprocess.Popen(cmd, cwd=REPO_DIR, env=env, start_new_session=True)
+    url = f"http://127.0.0.1:{port}"
+    client = Client(url, 5)
+    deadline = time.time() + opts.startup_timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with {server.returncode}")
+        try:
+            status, body = client.json("GET", "/readyz")
+            if status == 200:
+                return server, url
+            failing = [name for name, passed in body.get("checks", {}).items() if not passed]
+            if failing and "warmup" not in failing:
+                log(f"  /readyz failing: {', '.join(failing)}")
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        time.sleep(0.5)
+    stop_server(server)
+    raise RuntimeError(f"API not ready after {opts.startup_timeout}s")
+
+def stop_server(server):
+    try:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(server.pid, signal.SIGKILL)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a request mix against the AMR API")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--serve", action="store_true", help="start uvicorn for the run")
+    parser.add_argument("--stub", action="store_true", help="serve with stub tools replaying fixtures")
+    parser.add_argument("--startup-timeout", type=int, default=180)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--genomes", nargs="+", default=[DEFAULT_GENOME])
+    parser.add_argument("--cache-hits", action="store_true",
+                        help="send genomes unchanged, so repeats are answered from the result cache")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=0, help="stop sending after this many seconds")
+    parser.add_argument("--concurrency", type=int, default=4, help="connections in flight")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="arrivals per second (Poisson); 0 = closed loop, as fast as connections free up")
+    parser.add_argument("--timeout", type=float, default=900, help="socket timeout per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="load_test_results")
+    opts = parser.parse_args()
+
+    mix = load_mix(opts.mix)
+    genomes = GenomeSource(genome_files(opts.genomes), unique=not opts.cache_hits)
+
+    log("=" * 60)
+    log("SCRIPT 8: LOAD TEST")
+    log(f"Started: {datetime.now()}")
+    log("=" * 60)
+
+    server = None
+    url = opts.url
+    if opts.serve or opts.stub:
+        log(f"Starting API{' with stub tools' if opts.stub else ''}...")
+        server, url = start_server(opts)
+    try:
+        log(f"Target: {url}, requests: {opts.requests}, concurrency: {opts.concurrency}, "
+            f"rate: {opts.rate or 'closed loop'}")
+        samples, duration = drive(Client(url, opts.timeout), mix, genomes, opts)
+        health = Client(url, 10).json("GET", "/health")[1]
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    summary = summarize(samples, duration)
+    config = {k: v for k, v in vars(opts).items()}
+    config.update(url=url, started=datetime.now().isoformat(), mix_entries=mix)
+    with open(f"{opts.out}.json", "w") as f:
+        json.dump({"config": config, "summary": summary, "server": health, "samples": samples}, f, indent=2)
+
+    log("")
+    log(f"Throughput: {summary['throughput_rps']} req/s, {summary['genomes_per_s']} genomes/s over {summary['duration_s']}s")
+    log(f"Status codes: {summary['status_codes']}")
+    log(f"Error rate: {summary['error_rate']}, timeouts: {summary['timeout_rate']}, "
+        f"429: {summary['rejected_rate']}, cached: {summary['cached_rate']}")
+    for label, key in (("Latency", "latency_s"), ("Client queue", "client_queue_s"), ("Server queue", "server_queue_s")):
+        stats = summary[key]
+        if stats:
+            log(f"{label:<13} p50 {stats['p50']:.3f}s  p90 {stats['p90']:.3f}s  p99 {stats['p99']:.3f}s  max {stats['max']:.3f}s")
+    for endpoint, stats in summary["by_endpoint"].items():
+        latency = stats["latency_s"]
+        log(f"  {endpoint:<15} {stats['requests']:>5} req, {stats['errors']} errors"
+            + (f", p50 {latency['p50']:.3f}s p99 {latency['p99']:.3f}s" if latency else ""))
+    log("")
+    log(f"✓ Results saved to: {opts.out}.json")
+    log("=" * 60)
+
+if __name__ == "__main__":
+    main()